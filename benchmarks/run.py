@@ -0,0 +1,203 @@
+"""
+Throughput and memory benchmarks of foobot_async against a local stand-in
+API server.
+
+Usage::
+
+    python benchmarks/run.py --devices 10,100 --days 1,7,42
+
+Results can be saved and compared to a previous run, failing when one of
+them is worse by more than the tolerance::
+
+    python benchmarks/run.py --save benchmarks/reference.json
+    python benchmarks/run.py --compare benchmarks/reference.json
+
+Memory results are deterministic; throughputs depend on the machine, so the
+stored ones are only meaningful on the machine that recorded them.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+from foobot_async import FoobotClient, OUTPUT_ROWS, OUTPUT_COLUMNS
+from server import SENSORS, SAMPLE_INTERVAL, datapoints, device_uuid, \
+    start_server
+
+END = 1518393600
+DEFAULT_TOLERANCE = 0.2
+
+results = {}
+
+
+def report(name, value, unit, note=''):
+    results[name] = dict(value=value, unit=unit)
+    print('{:<48} {:>14,.1f} {}{}'.format(name, value, unit, note))
+
+
+def compare(reference, tolerance):
+    """
+    Compare the results with reference ones.
+
+    :returns: list of (name, value, reference value) of the results worse
+        than their reference by more than `tolerance`, as a fraction
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in reference:
+            continue
+        expected = reference[name]['value']
+        if result['unit'].startswith('bytes'):
+            # memory, lower is better
+            worse = result['value'] > expected * (1 + tolerance)
+        else:
+            worse = result['value'] < expected * (1 - tolerance)
+        if worse:
+            regressions.append((name, result['value'], expected))
+    return regressions
+
+
+def bench_parse(days, output, repeat):
+    client = FoobotClient('token', 'bench@example.com')
+    response = {"sensors": SENSORS,
+                "datapoints": datapoints(device_uuid(0),
+                                         END - days * 86400, END)}
+    rows = len(response['datapoints'])
+    started = time.perf_counter()
+    for _ in range(repeat):
+        client.parse_data(response, output)
+    elapsed = time.perf_counter() - started
+    report('parse_data {} {}d'.format(output, days),
+           rows * repeat / elapsed, 'rows/s')
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parsed = client.parse_data(response, output)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del parsed
+    report('memory {} {}d'.format(output, days),
+           (after - before) / rows, 'bytes/datapoint')
+
+
+async def bench_last_data(base_url, devices, concurrency):
+    uuids = [device_uuid(index) for index in range(devices)]
+    async with FoobotClient('token', 'bench@example.com',
+                            base_url=base_url) as client:
+        started = time.perf_counter()
+        failures = 0
+        async for _, result in client.get_last_data_many(
+                uuids, concurrency=concurrency):
+            failures += isinstance(result, Exception)
+        elapsed = time.perf_counter() - started
+    report('get_last_data_many {} devices'.format(devices),
+           devices / elapsed, 'req/s', ' ({} failed)'.format(failures))
+
+
+async def bench_historical_data(base_url, devices, days, concurrency):
+    uuids = [device_uuid(index) for index in range(devices)]
+    start = datetime.utcfromtimestamp(END - days * 86400)
+    end = datetime.utcfromtimestamp(END)
+    async with FoobotClient('token', 'bench@example.com',
+                            base_url=base_url) as client:
+        started = time.perf_counter()
+        rows = 0
+        async for _, result in client.get_historical_data_many(
+                uuids, start, end, concurrency=concurrency,
+                output=OUTPUT_COLUMNS):
+            if not isinstance(result, Exception):
+                rows += len(result['time'])
+        elapsed = time.perf_counter() - started
+    report('get_historical_data_many {} devices {}d'.format(devices, days),
+           rows / elapsed, 'rows/s')
+
+    # the whole fleet is kept to measure the memory of its datapoints
+    async with FoobotClient('token', 'bench@example.com',
+                            base_url=base_url) as client:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        fleet = [result async for _, result in client.get_historical_data_many(
+            uuids, start, end, concurrency=concurrency,
+            output=OUTPUT_COLUMNS)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    rows = sum(len(result['time']) for result in fleet
+               if not isinstance(result, Exception))
+    del fleet
+    report('memory get_historical_data_many {} devices {}d'.format(
+        devices, days), (after - before) / max(1, rows), 'bytes/datapoint')
+
+
+async def bench_api(args):
+    runner, base_url = await start_server(devices=max(args.devices),
+                                          latency=args.latency,
+                                          error_rate=args.error_rate)
+    try:
+        for devices in args.devices:
+            await bench_last_data(base_url, devices, args.concurrency)
+        for devices in args.devices:
+            for days in args.days:
+                await bench_historical_data(base_url, devices, days,
+                                            args.concurrency)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    def integers(value):
+        return [int(item) for item in value.split(',')]
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--devices', type=integers, default=[10, 100],
+                        help='comma separated fleet sizes')
+    parser.add_argument('--days', type=integers, default=[1, 7],
+                        help='comma separated history lengths in days')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='stand-in server latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests failing with a 500')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='parse_data iterations')
+    parser.add_argument('--save', metavar='FILE',
+                        help='write the results to a JSON file')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results to a JSON file of '
+                        'reference results')
+    parser.add_argument('--tolerance', type=float,
+                        default=DEFAULT_TOLERANCE,
+                        help='fraction by which a result can be worse than '
+                        'its reference')
+    args = parser.parse_args()
+
+    print('{} datapoints per device and day'.format(86400 // SAMPLE_INTERVAL))
+    for days in args.days:
+        for output in (OUTPUT_ROWS, OUTPUT_COLUMNS):
+            bench_parse(days, output, args.repeat)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(bench_api(args))
+    finally:
+        loop.close()
+
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as reference:
+            regressions = compare(json.load(reference), args.tolerance)
+        for name, value, expected in regressions:
+            print('Regression: {} {:,.1f} instead of {:,.1f}'.format(
+                name, value, expected))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Local stand-in for the Foobot API, serving synthetic sensor data.
+"""
+import asyncio
+import random
+import time
+import zlib
+from aiohttp import web
+
+SENSORS = ["time", "pm", "tmp", "hum", "co2", "voc", "allpollu"]
+UNITS = ["s", "ugm3", "C", "pc", "ppm", "ppb", "%"]
+SAMPLE_INTERVAL = 300
+
+
+def device_uuid(index):
+    return '{:015X}'.format(0x1234127987696AB + index)
+
+
+def datapoints(uuid, start, end, average_by=0):
+    """
+    Generate deterministic datapoints for a device between start and end.
+    """
+    step = max(SAMPLE_INTERVAL, average_by)
+    first = start - start % step + (step if start % step else 0)
+    rows = []
+    for timestamp in range(first, end + 1, step):
+        rng = random.Random(zlib.crc32(uuid.encode()) ^ timestamp)
+        rows.append([timestamp,
+                     round(rng.uniform(0, 150), 5),
+                     round(rng.uniform(15, 30), 5),
+                     round(rng.uniform(20, 80), 5),
+                     round(rng.uniform(400, 2500), 1),
+                     round(rng.uniform(100, 1000), 1),
+                     round(rng.uniform(0, 200), 5)])
+    return rows
+
+
+def make_app(devices=10, latency=0.0, error_rate=0.0, seed=0):
+    """
+    Create the stand-in API application.
+
+    :param devices: number of devices owned by every user
+    :param latency: seconds to wait before answering each request
+    :param error_rate: fraction of requests answered with a 500 error
+    :param seed: seed of the error generator
+    """
+    errors = random.Random(seed)
+
+    async def delay():
+        if latency:
+            await asyncio.sleep(latency)
+        if errors.random() < error_rate:
+            raise web.HTTPInternalServerError(text='{"message": "error"}')
+
+    def payload(uuid, start, end, average_by):
+        return {"uuid": uuid, "start": start, "end": end,
+                "sensors": SENSORS, "units": UNITS,
+                "datapoints": datapoints(uuid, start, end, average_by)}
+
+    async def get_devices(request):
+        await delay()
+        return web.json_response([
+            {"uuid": device_uuid(index), "userId": 2353,
+             "mac": '{:012X}'.format(index), "name": "FooBot {}".format(index)}
+            for index in range(devices)])
+
+    async def get_last_data(request):
+        await delay()
+        period = int(request.match_info['period'])
+        average_by = int(request.match_info['average_by'])
+        end = int(time.time())
+        end -= end % SAMPLE_INTERVAL
+        return web.json_response(payload(request.match_info['uuid'],
+                                         end - period, end, average_by))
+
+    async def get_historical_data(request):
+        await delay()
+        return web.json_response(payload(
+            request.match_info['uuid'],
+            int(request.match_info['start']),
+            int(request.match_info['end']),
+            int(request.match_info['average_by'])))
+
+    app = web.Application()
+    app.router.add_get('/v2/owner/{username}/device/', get_devices)
+    app.router.add_get(
+        r'/v2/device/{uuid}/datapoint/{period:\d+}/last/{average_by:\d+}/',
+        get_last_data)
+    app.router.add_get(
+        r'/v2/device/{uuid}/datapoint/{start:\d+}/{end:\d+}/'
+        r'{average_by:\d+}/',
+        get_historical_data)
+    return app
+
+
+async def start_server(host='127.0.0.1', port=0, **kwargs):
+    """
+    Start the stand-in API in the running event loop.
+
+    :returns: (runner, base URL to give to FoobotClient)
+    """
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, 'http://{}:{}/v2/'.format(host, port)
+
+
+if __name__ == '__main__':
+    web.run_app(make_app(), host='127.0.0.1', port=8080)
@@ -1,9 +1,49 @@
+from array import array
 from math import trunc
-from datetime import timezone
+from datetime import datetime, timezone, timedelta
 import asyncio
+import codecs
+import copy
+import email.utils
+import json
+import random
+import re
+import time
 import aiohttp
 import async_timeout
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+from .breaker import CircuitBreaker, StaleList, StaleDict, mark_stale
+from .cache import ResponseCache, ENDPOINT_DEVICES, ENDPOINT_LAST, \
+    ENDPOINT_HISTORICAL
+from .latency import LatencyTracker
+from .metrics import Metrics
+from .ratelimit import RateLimiter, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+# the helpers a client is configured with are exported along with it
+__all__ = ['FoobotClient', 'CircuitBreaker', 'ResponseCache',
+           'LatencyTracker', 'Metrics', 'RateLimiter', 'StaleList',
+           'StaleDict', 'BASE_URL', 'DEVICE_URL', 'LAST_DATA_URL',
+           'HISTORICAL_DATA_URL', 'DEFAULT_CONCURRENCY',
+           'DEFAULT_BATCH_SIZE', 'MAX_HISTORICAL_RANGE', 'SETTLE_DELAY',
+           'THROTTLE_DELAY', 'ADAPTIVE_TIMEOUT_FACTOR',
+           'MIN_ADAPTIVE_TIMEOUT', 'MAX_HEDGE_BURST', 'SENSORS',
+           'OUTPUT_ROWS', 'OUTPUT_COLUMNS', 'OUTPUT_NUMPY',
+           'ENDPOINT_DEVICES', 'ENDPOINT_LAST', 'ENDPOINT_HISTORICAL',
+           'PRIORITY_INTERACTIVE', 'PRIORITY_BULK']
+
 BASE_URL = "https://api.foobot.io/v2/"
 DEVICE_URL = BASE_URL + 'owner/{username}/device/'
 LAST_DATA_URL = BASE_URL + \
@@ -11,6 +51,25 @@ LAST_DATA_URL = BASE_URL + \
 HISTORICAL_DATA_URL = BASE_URL + \
                 "device/{uuid}/datapoint/{start:d}/{end:d}/{average_by:d}/"
 
+DEFAULT_CONCURRENCY = 10
+DEFAULT_BATCH_SIZE = 1000
+MAX_HISTORICAL_RANGE = timedelta(days=42)
+# delay after which datapoints are not expected to change anymore
+SETTLE_DELAY = timedelta(hours=1)
+# seconds a key is considered over quota after a 429 without Retry-After
+THROTTLE_DELAY = 60
+# adaptive timeouts are this multiple of the p99 latency, within bounds
+ADAPTIVE_TIMEOUT_FACTOR = 3
+MIN_ADAPTIVE_TIMEOUT = 1
+# number of hedged requests that can be saved up from the hedging budget
+MAX_HEDGE_BURST = 10
+
+SENSORS = ('time', 'pm', 'tmp', 'hum', 'co2', 'voc', 'allpollu')
+
+OUTPUT_ROWS = 'rows'
+OUTPUT_COLUMNS = 'columns'
+OUTPUT_NUMPY = 'numpy'
+
 
 class FoobotClient():
     """
@@ -21,23 +80,159 @@ class FoobotClient():
     :type token: str
     :param username: Your username for your Foobot account
     :type username: str
-    :param session: aiohttp session to use or None
+    :param session: aiohttp session to use or None. A session given here is
+        not closed by the client.
     :type session: object or None
     :param timeout: seconds to wait for before triggering a timeout
     :type timeout: integer
+    :param rate_limiter: rate limiter shared by every request of this client,
+        paused when the server answers TooManyRequests
+    :type rate_limiter: RateLimiter or None
+    :param retries: number of times a request failing with TooManyRequests or
+        InternalError is retried
+    :type retries: integer
+    :param backoff: base delay in seconds between retries, doubled on each
+        attempt and randomized. The server Retry-After header takes
+        precedence when present.
+    :type backoff: float
+    :param max_backoff: maximum delay in seconds between retries. Requests
+        the server asks to retry later than that are not retried.
+    :type max_backoff: float
+    :param cache: cache for API responses. Historical ranges ending more than
+        `SETTLE_DELAY` ago never expire.
+    :type cache: ResponseCache or None
+    :param connector: aiohttp connector to share between several clients, or
+        None to create one owned by this client
+    :type connector: aiohttp.BaseConnector or None
+    :param limit: maximum number of simultaneous connections of the
+        client's own connector
+    :type limit: integer
+    :param limit_per_host: maximum number of simultaneous connections per
+        host of the client's own connector, 0 for no limit
+    :type limit_per_host: integer
+    :param keepalive_timeout: seconds idle connections of the client's own
+        connector are kept open for
+    :type keepalive_timeout: float
+    :param dns_cache_ttl: seconds DNS resolutions of the client's own
+        connector are cached for, None to cache them forever
+    :type dns_cache_ttl: integer or None
+    :param metrics: collector of requests and parsing metrics
+    :type metrics: Metrics or None
+    :param base_url: root URL of the API, e.g. to use a local stand-in server
+    :type base_url: str
+    :param json_loads: function decoding JSON from bytes, by default the
+        fastest available of orjson, ujson and the standard library
+    :type json_loads: callable
+    :param adaptive_timeout: derive the timeout of each endpoint type from
+        its observed latency (`ADAPTIVE_TIMEOUT_FACTOR` times its p99),
+        never exceeding `timeout`
+    :type adaptive_timeout: bool
+    :param hedge: send a second identical request when the first one takes
+        longer than the p95 latency of its endpoint type, and use the first
+        answer
+    :type hedge: bool
+    :param hedge_budget: maximum fraction of requests that can be hedged
+    :type hedge_budget: float
+    :param stale_while_revalidate: keep the last good response of each
+        query and trip a circuit breaker per endpoint type after
+        `failure_threshold` consecutive InternalError, timeouts or connection
+        errors. While it is open, the last good response is returned at once
+        as a :class:`StaleList` or :class:`StaleDict` whose `age` attribute
+        gives its age in seconds, and refreshed in the background every
+        `reset_timeout` seconds. Queries without any good response raise
+        CircuitOpen.
+    :type stale_while_revalidate: bool
+    :param failure_threshold: consecutive failures opening a circuit breaker
+    :type failure_threshold: integer
+    :param reset_timeout: seconds between two attempts to close an open
+        circuit breaker
+    :type reset_timeout: float
+
+    .. note::
+        The client is an async context manager, closing the session and
+        connector it created on exit:
+
+        .. code-block:: python
+
+            async with FoobotClient(token, username) as client:
+                devices = await client.get_devices()
     """
 
     def __init__(self, token, username, session=None,
-                 timeout=aiohttp.client.DEFAULT_TIMEOUT.total):
+                 timeout=aiohttp.client.DEFAULT_TIMEOUT.total,
+                 rate_limiter=None, retries=0, backoff=0.5, max_backoff=60,
+                 cache=None, connector=None, limit=100, limit_per_host=0,
+                 keepalive_timeout=30, dns_cache_ttl=300, metrics=None,
+                 base_url=BASE_URL, json_loads=json_loads,
+                 adaptive_timeout=False, hedge=False, hedge_budget=0.05,
+                 stale_while_revalidate=False, failure_threshold=5,
+                 reset_timeout=30):
         """
         Creates a new :class:`FoobotClient` instance.
         """
         self._headers = {'X-API-KEY-TOKEN': token,
-                         'content-type': 'application/json'}
+                         'content-type': 'application/json',
+                         'Accept-Encoding': 'gzip, deflate'}
         self._username = username
         self._timeout = timeout
-        if session is not None:
-            self._session = session
+        self._rate_limiter = rate_limiter
+        self._retries = retries
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._cache = cache
+        self._inflight = {}
+        self._metrics = metrics
+        self._base_url = base_url
+        self._json_loads = json_loads
+        self._adaptive_timeout = adaptive_timeout
+        self._hedge = hedge
+        self._hedge_budget = hedge_budget
+        self._hedge_tokens = 0
+        self._latency = LatencyTracker() \
+            if adaptive_timeout or hedge else None
+        self._breakers = None
+        self._last_good = None
+        self._refreshes = set()
+        if stale_while_revalidate:
+            self._breakers = {
+                endpoint: CircuitBreaker(failure_threshold, reset_timeout)
+                for endpoint in (ENDPOINT_DEVICES, ENDPOINT_LAST,
+                                 ENDPOINT_HISTORICAL)}
+            self._last_good = ResponseCache(
+                maxsize=1024, ttl={ENDPOINT_DEVICES: None,
+                                   ENDPOINT_LAST: None,
+                                   ENDPOINT_HISTORICAL: None})
+        #: requests left in the API key quota, as last reported by the API
+        self.quota_remaining = None
+        #: time.monotonic() until which the API key is rejected for exceeding
+        #: its quota, or None
+        self.throttled_until = None
+        self._session = session
+        self._owns_session = session is None
+        self._connector = connector
+        self._connector_options = dict(limit=limit,
+                                       limit_per_host=limit_per_host,
+                                       keepalive_timeout=keepalive_timeout,
+                                       ttl_dns_cache=dns_cache_ttl)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the session and connector created by this client, if any.
+
+        The client can still be used afterwards, a new session is then
+        created.
+        """
+        for refresh in list(self._refreshes):
+            refresh.cancel()
+        if self._owns_session and self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
 
     async def get_devices(self):
         """
@@ -56,10 +251,15 @@ class FoobotClient():
                 (eg: "013843C3C20A")
                 * name: Name of the device as configured in the app
         """
-        return (await self._get(DEVICE_URL.format(
-            username=self._username)))
+        devices = await self._get(self._url(
+            DEVICE_URL, username=self._username))
+        # the response may be cached or shared with concurrent callers
+        if isinstance(devices, StaleList):
+            return mark_stale(copy.deepcopy(list(devices)), devices.age)
+        return copy.deepcopy(devices)
 
-    async def get_last_data(self, uuid, period=0, average_by=0):
+    async def get_last_data(self, uuid, period=0, average_by=0,
+                            output=OUTPUT_ROWS, priority=PRIORITY_INTERACTIVE):
         """
         Get the data from one device for period till now.
 
@@ -71,6 +271,10 @@ class FoobotClient():
             0 or 300 for no average. Use 3600 (average hourly) or a multiple
             for long range requests (e.g. more than 1 day)
         :type average_by: integer
+        :param output: datapoints format, see :func:`parse_data`
+        :type output: str
+        :param priority: rate limiter priority, lower is served first
+        :type priority: integer
         :returns: list of datapoints
         :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
                  TooManyRequests, InternalError
@@ -83,20 +287,28 @@ class FoobotClient():
 
         .. seealso:: :func:`parse_data` for return data syntax
         """
-        return self.parse_data((await self._get(
-            LAST_DATA_URL.format(uuid=uuid,
-                                 period=trunc(period),
-                                 average_by=trunc(average_by)))))
+        return self._parse(ENDPOINT_LAST, (await self._get(
+            self._url(LAST_DATA_URL,
+                      uuid=uuid,
+                      period=trunc(period),
+                      average_by=trunc(average_by)),
+            priority=priority)), output)
 
-    async def get_historical_data(self, uuid, start, end, average_by=0):
+    async def get_historical_data(self, uuid, start, end, average_by=0,
+                                  concurrency=DEFAULT_CONCURRENCY,
+                                  output=OUTPUT_ROWS, priority=PRIORITY_BULK):
         """
         Get the data from one device for a specified time range.
 
         .. note::
-            Can fetch a maximum of 42 days of data.
+            The API can fetch a maximum of 42 days of data per request.
+            Longer ranges are split into consecutive windows which are
+            fetched concurrently, at most `concurrency` at a time, and merged
+            back into a single time-ordered list.
             To speed up query processing, you can use a combination of average
             factor multiple of 1H in seconds (e.g. 3600)
-            and o'clock start and end times
+            and o'clock start and end times, or let
+            :func:`foobot_async.planner.fetch_matrix` align the requests
 
         :param uuid: Id of the device
         :type uuid: str
@@ -108,27 +320,191 @@ class FoobotClient():
             0 or 300 for no average. Use 3600 (average hourly) or a multiple
             for long range requests (e.g. more than 1 day)
         :type average_by: integer
+        :param concurrency: maximum number of requests in flight when the
+            range has to be split
+        :type concurrency: integer
+        :param output: datapoints format, see :func:`parse_data`
+        :type output: str
+        :param priority: rate limiter priority, lower is served first
+        :type priority: integer
         :returns: list of datapoints
         :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
                  TooManyRequests, InternalError
 
         .. seealso:: :func:`parse_data` for return data syntax
         """
-        return self.parse_data((await self._get(
-            HISTORICAL_DATA_URL.format(
+        windows = self._split_range(
+            trunc(start.replace(tzinfo=timezone.utc).timestamp()),
+            trunc(end.replace(tzinfo=timezone.utc).timestamp()),
+            trunc(average_by))
+        settled = (datetime.now(timezone.utc) - SETTLE_DELAY).timestamp()
+        responses = await self._gather(
+            [self._get(self._url(
+                HISTORICAL_DATA_URL,
                 uuid=uuid,
-                start=trunc(start.replace(tzinfo=timezone.utc).timestamp()),
-                end=trunc(end.replace(tzinfo=timezone.utc).timestamp()),
-                average_by=trunc(average_by)))))
+                start=window_start,
+                end=window_end,
+                average_by=trunc(average_by)),
+                priority=priority,
+                immutable=window_end <= settled)
+             for window_start, window_end in windows],
+            concurrency)
+        if len(responses) == 1:
+            return self._parse(ENDPOINT_HISTORICAL, responses[0], output)
+        return self._parse(ENDPOINT_HISTORICAL,
+                           self._merge_responses(responses), output)
 
-    def parse_data(self, response):
+    async def get_last_data_many(self, uuids, period=0, average_by=0,
+                                 concurrency=DEFAULT_CONCURRENCY,
+                                 output=OUTPUT_ROWS,
+                                 priority=PRIORITY_INTERACTIVE):
+        """
+        Get the data from several devices for period till now.
+
+        Requests are run concurrently, at most `concurrency` at a time, and
+        results are yielded as soon as they are available, in completion
+        order.
+
+        :param uuids: Ids of the devices
+        :type uuids: iterable of str
+        :param period: Number of seconds between start time of search and now
+        :type period: integer
+        :param average_by: amount of seconds to average data over.
+        :type average_by: integer
+        :param concurrency: maximum number of requests in flight
+        :type concurrency: integer
+        :param output: datapoints format, see :func:`parse_data`
+        :type output: str
+        :param priority: rate limiter priority, lower is served first
+        :type priority: integer
+        :returns: async iterator of (uuid, list of datapoints or exception)
+
+        .. note::
+            A failing device does not stop the others: its exception is
+            yielded in place of its datapoints.
+
+        .. seealso:: :func:`get_last_data`
+        """
+        async for result in self._fan_out(
+                uuids,
+                lambda uuid: self.get_last_data(uuid, period, average_by,
+                                                output=output,
+                                                priority=priority),
+                concurrency):
+            yield result
+
+    async def get_historical_data_many(self, uuids, start, end, average_by=0,
+                                       concurrency=DEFAULT_CONCURRENCY,
+                                       output=OUTPUT_ROWS,
+                                       priority=PRIORITY_BULK):
+        """
+        Get the data from several devices for a specified time range.
+
+        Requests are run concurrently, at most `concurrency` at a time, and
+        results are yielded as soon as they are available, in completion
+        order.
+
+        :param uuids: Ids of the devices
+        :type uuids: iterable of str
+        :param start: start of the range
+        :type start: datetime
+        :param end: end of the range
+        :type end: datetime
+        :param average_by: amount of seconds to average data over.
+        :type average_by: integer
+        :param concurrency: maximum number of requests in flight
+        :type concurrency: integer
+        :param output: datapoints format, see :func:`parse_data`
+        :type output: str
+        :param priority: rate limiter priority, lower is served first
+        :type priority: integer
+        :returns: async iterator of (uuid, list of datapoints or exception)
+
+        .. note::
+            A failing device does not stop the others: its exception is
+            yielded in place of its datapoints.
+
+        .. seealso:: :func:`get_historical_data`
+        """
+        async for result in self._fan_out(
+                uuids,
+                lambda uuid: self.get_historical_data(uuid, start, end,
+                                                      average_by,
+                                                      output=output,
+                                                      priority=priority),
+                concurrency):
+            yield result
+
+    async def iter_historical_data(self, uuid, start, end, average_by=0,
+                                   batch_size=DEFAULT_BATCH_SIZE,
+                                   priority=PRIORITY_BULK):
+        """
+        Stream the data from one device for a specified time range.
+
+        The response is parsed incrementally as it is downloaded, so
+        datapoints are available before the download completes and memory
+        use is bounded by `batch_size` rather than by the size of the range.
+        Ranges longer than the API limit are fetched one window after the
+        other. Failed requests are not retried, as part of the data may
+        already have been yielded.
+
+        Datapoints can only be parsed once the sensors are known: they are
+        streamed when the response lists `sensors` before `datapoints`, as
+        the API does, and are otherwise all held until the download
+        completes.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param start: start of the range
+        :type start: datetime
+        :param end: end of the range
+        :type end: datetime
+        :param average_by: amount of seconds to average data over.
+        :type average_by: integer
+        :param batch_size: maximum number of datapoints per batch
+        :type batch_size: integer
+        :param priority: rate limiter priority, lower is served first
+        :type priority: integer
+        :returns: async iterator of lists of datapoints
+        :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
+                 TooManyRequests, InternalError
+
+        .. seealso:: :func:`get_historical_data`, :func:`parse_data` for
+            datapoints syntax
+        """
+        last_time = None
+        for window_start, window_end in self._split_range(
+                trunc(start.replace(tzinfo=timezone.utc).timestamp()),
+                trunc(end.replace(tzinfo=timezone.utc).timestamp()),
+                trunc(average_by)):
+            async for batch in self._iter_datapoints(
+                    self._url(
+                        HISTORICAL_DATA_URL,
+                        uuid=uuid,
+                        start=window_start,
+                        end=window_end,
+                        average_by=trunc(average_by)),
+                    batch_size, priority):
+                if last_time is not None:
+                    # consecutive windows share their boundary datapoint
+                    batch = [datapoint for datapoint in batch
+                             if datapoint['time'] > last_time]
+                if batch:
+                    last_time = batch[-1]['time']
+                    yield batch
+
+    def parse_data(self, response, output=OUTPUT_ROWS):
         """
         Convert the weird list format used for datapoints to a more usable
         dictionnary one
 
         :param response: dictionnary from API json response
         :type response: dict
-        :returns: list of datapoints
+        :param output: `OUTPUT_ROWS` (default) for a list of dictionnaries,
+            `OUTPUT_COLUMNS` for one `array.array` per sensor or
+            `OUTPUT_NUMPY` for one numpy array per sensor (requires numpy)
+        :type output: str
+        :returns: list of datapoints, or dictionnary of sensor columns
 
         .. note::
             Datapoint content:
@@ -139,7 +515,36 @@ class FoobotClient():
                 * co2: Carbon Dioxide, unit: ppm
                 * voc: Volatile Organic Compounds, unit: ppb
                 * allpollu: `foobot index <https://help.foobot.io/hc/en-us/articles/204814371-What-does-central-number-mean->`_, unit: %
+
+        .. note::
+            Columnar outputs store time as 64 bits integers and every other
+            sensor as 64 bits floats, which is far more compact than one
+            dictionnary per datapoint for long histories.
         """
+        if output == OUTPUT_ROWS:
+            return self._parse_rows(response)
+        elif output == OUTPUT_COLUMNS:
+            return self._parse_columns(response, array)
+        elif output == OUTPUT_NUMPY:
+            if numpy is None:
+                raise ImportError("numpy is required for numpy output")
+            return self._parse_columns(
+                response,
+                lambda typecode, column: numpy.array(column, dtype=typecode))
+        raise ValueError("Unknown output format: {}".format(output))
+
+    def _parse(self, endpoint, response, output):
+        started = time.monotonic()
+        parsed = self.parse_data(response, output)
+        if self._metrics is not None:
+            self._metrics.observe_parse(endpoint, time.monotonic() - started,
+                                        len(response['datapoints']))
+        if isinstance(response, StaleDict):
+            return mark_stale(parsed, response.age)
+        return parsed
+
+    @staticmethod
+    def _parse_rows(response):
         parsed = []
         try:
             items = response['sensors']
@@ -152,30 +557,384 @@ class FoobotClient():
         except (KeyError, IndexError, TypeError):
             raise FoobotClient.InvalidData()
 
-    async def _get(self, path, **kwargs):
-        if not hasattr(self, '_session'):
-            self._session = aiohttp.ClientSession()
-        with async_timeout.timeout(self._timeout):
-            resp = await self._session.get(
-                    path, headers=dict(self._headers, **kwargs))
-            resp_text = await resp.text()
-            if resp.status == 400:
-                raise FoobotClient.BadFormat(resp_text)
-            elif resp.status == 401:
-                raise FoobotClient.AuthFailure(resp_text)
-            elif resp.status == 403:
-                raise FoobotClient.ForbiddenAccess(resp_text)
-            elif resp.status == 429:
-                raise FoobotClient.TooManyRequests(resp_text)
-            elif resp.status == 500:
-                raise FoobotClient.InternalError(resp_text)
-            elif resp.status != 200:
-                raise FoobotClient.ClientError(resp_text)
-            return (await resp.json())
+    @staticmethod
+    def _parse_columns(response, factory):
+        try:
+            items = response['sensors']
+            datapoints = response['datapoints']
+            if any(len(datapoint) != len(items) for datapoint in datapoints):
+                raise FoobotClient.InvalidData()
+            columns = zip(*datapoints) if datapoints else [()] * len(items)
+            return {item: factory('q' if item == 'time' else 'd', column)
+                    for item, column in zip(items, columns)}
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise FoobotClient.InvalidData()
+
+    @staticmethod
+    def _split_range(start, end, average_by):
+        window = trunc(MAX_HISTORICAL_RANGE.total_seconds())
+        if average_by > window:
+            # a single average over the whole range
+            return [(start, end)]
+        if average_by > 0:
+            # keep averaging buckets from straddling two windows
+            window -= window % average_by
+        windows = []
+        window_start = start
+        while True:
+            window_end = min(window_start + window, end)
+            windows.append((window_start, window_end))
+            if window_end >= end:
+                return windows
+            window_start = window_end
+
+    @staticmethod
+    def _merge_responses(responses):
+        try:
+            merged = dict(responses[0])
+            sensors = merged['sensors']
+            time_index = sensors.index('time')
+            datapoints = {}
+            for response in responses:
+                if response['sensors'] != sensors:
+                    raise FoobotClient.InvalidData()
+                for datapoint in response['datapoints']:
+                    datapoints[datapoint[time_index]] = datapoint
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise FoobotClient.InvalidData()
+        merged['start'] = responses[0].get('start')
+        merged['end'] = responses[-1].get('end')
+        merged['datapoints'] = [datapoints[datapoint_time]
+                                for datapoint_time in sorted(datapoints)]
+        ages = [response.age for response in responses
+                if isinstance(response, StaleDict)]
+        if ages:
+            return mark_stale(merged, max(ages))
+        return merged
+
+    @staticmethod
+    async def _gather(coroutines, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(coroutine):
+            async with semaphore:
+                return (await coroutine)
+
+        tasks = [asyncio.ensure_future(run(coroutine))
+                 for coroutine in coroutines]
+        try:
+            return (await asyncio.gather(*tasks))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fan_out(self, uuids, fetch, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(uuid):
+            async with semaphore:
+                try:
+                    return uuid, (await fetch(uuid))
+                except (FoobotClient.ClientError, aiohttp.ClientError,
+                        asyncio.TimeoutError) as error:
+                    return uuid, error
+
+        tasks = [asyncio.ensure_future(run(uuid)) for uuid in uuids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield (await next_done)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _url(self, template, **kwargs):
+        return self._base_url + template[len(BASE_URL):].format(**kwargs)
+
+    def _client_session(self):
+        if self._session is None:
+            if self._connector is not None:
+                self._session = aiohttp.ClientSession(
+                    connector=self._connector, connector_owner=False)
+            else:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        **self._connector_options))
+        return self._session
+
+    async def _get(self, path, priority=PRIORITY_INTERACTIVE, immutable=False,
+                   **kwargs):
+        # extra headers may change the response, don't cache those requests
+        cache = self._cache if not kwargs else None
+        if cache is not None:
+            response = cache.get(path)
+            if response is not None:
+                return response
+        if self._breakers is None:
+            return (await self._coalesced(path, priority, cache, immutable,
+                                          **kwargs))
+        breaker = self._breakers[_endpoint(path)]
+        stale = self._last_good.get(path)
+        if not breaker.closed:
+            trial = breaker.allow()
+            if stale is not None:
+                if trial:
+                    refresh = asyncio.ensure_future(self._revalidate(
+                        path, breaker, priority, cache, immutable, **kwargs))
+                    self._refreshes.add(refresh)
+                    refresh.add_done_callback(self._refreshed)
+                return mark_stale(stale[0], time.time() - stale[1])
+            if not trial:
+                raise FoobotClient.CircuitOpen(path)
+            return (await self._revalidate(path, breaker, priority, cache,
+                                           immutable, **kwargs))
+        return (await self._coalesced(path, priority, cache, immutable,
+                                      **kwargs))
+
+    async def _revalidate(self, path, breaker, priority, cache, immutable,
+                          **kwargs):
+        try:
+            return (await self._coalesced(path, priority, cache, immutable,
+                                          **kwargs))
+        finally:
+            # whatever the outcome, e.g. cancelled, let another trial in
+            breaker.release()
+
+    def _record_outcome(self, path, flight):
+        # once per network call, however many callers share it
+        breaker = self._breakers[_endpoint(path)]
+        error = flight.exception()
+        if isinstance(error, (FoobotClient.InternalError, asyncio.TimeoutError,
+                              aiohttp.ClientConnectionError)):
+            breaker.record_failure()
+            return
+        # any other answer shows the API is up
+        breaker.record_success()
+        if error is None:
+            self._last_good.set(path, (flight.result(), time.time()),
+                                _endpoint(path))
+
+    def _refreshed(self, refresh):
+        self._refreshes.discard(refresh)
+        if not refresh.cancelled():
+            # failures are already accounted for by the circuit breaker
+            refresh.exception()
+
+    async def _coalesced(self, path, priority, cache, immutable, **kwargs):
+        # identical requests in flight share a single network call, made
+        # with the priority of the first caller
+        key = (path, tuple(sorted(kwargs.items())))
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(
+                self._fetch(path, priority, **kwargs))
+            self._inflight[key] = flight
+
+            def land(flight):
+                del self._inflight[key]
+                if flight.cancelled():
+                    return
+                if self._breakers is not None:
+                    self._record_outcome(path, flight)
+                if flight.exception() is not None:
+                    return
+                if cache is not None:
+                    cache.set(path, flight.result(), _endpoint(path),
+                              immutable)
+
+            flight.add_done_callback(land)
+        # a cancelled caller must not cancel the call for the other ones
+        return (await asyncio.shield(flight))
+
+    async def _fetch(self, path, priority, **kwargs):
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire(priority)
+            try:
+                if self._hedge:
+                    return (await self._hedged_request(path, **kwargs))
+                return (await self._request(path, **kwargs))
+            except (FoobotClient.TooManyRequests,
+                    FoobotClient.InternalError) as error:
+                if isinstance(error, FoobotClient.TooManyRequests) and \
+                        self._rate_limiter is not None:
+                    # hold back every request sharing the limiter as well
+                    self._rate_limiter.pause(
+                        THROTTLE_DELAY if error.retry_after is None
+                        else error.retry_after)
+                if attempt >= self._retries or (
+                        error.retry_after is not None
+                        and error.retry_after > self._max_backoff):
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt,
+                                                      error.retry_after))
+                attempt += 1
+
+    def _retry_delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self._backoff)
+        return random.uniform(0, min(self._max_backoff,
+                                     self._backoff * 2 ** attempt))
+
+    async def _hedged_request(self, path, **kwargs):
+        self._hedge_tokens = min(MAX_HEDGE_BURST,
+                                 self._hedge_tokens + self._hedge_budget)
+        tasks = [asyncio.ensure_future(self._request(path, **kwargs))]
+        try:
+            done, _ = await asyncio.wait(
+                tasks, timeout=self._latency.percentile(_endpoint(path), 95))
+            if not done and self._hedge_tokens >= 1 and (
+                    self._rate_limiter is None
+                    or self._rate_limiter.try_acquire()):
+                self._hedge_tokens -= 1
+                tasks.append(asyncio.ensure_future(
+                    self._request(path, **kwargs)))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _timeout_for(self, endpoint):
+        if not self._adaptive_timeout:
+            return self._timeout
+        latency = self._latency.percentile(endpoint, 99)
+        if latency is None:
+            return self._timeout
+        return min(self._timeout, max(MIN_ADAPTIVE_TIMEOUT,
+                                      latency * ADAPTIVE_TIMEOUT_FACTOR))
+
+    async def _request(self, path, **kwargs):
+        endpoint = _endpoint(path)
+        started = time.monotonic()
+        timeout = self._timeout_for(endpoint)
+        try:
+            async with async_timeout.timeout(timeout):
+                resp = await self._client_session().get(
+                        path, headers=dict(self._headers, **kwargs))
+                received = time.monotonic()
+                body = await resp.read()
+        except asyncio.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.observe_timeout(endpoint)
+            if self._latency is not None:
+                # the request took at least that long: count it, so that
+                # an adaptive timeout grows back when the API slows down
+                self._latency.observe(endpoint, timeout)
+            raise
+        if self._metrics is not None:
+            self._metrics.observe_request(endpoint, resp.status,
+                                          received - started,
+                                          time.monotonic() - received,
+                                          len(body))
+        if self._latency is not None:
+            self._latency.observe(endpoint, time.monotonic() - started)
+        self._track_quota(resp)
+        if resp.status != 200:
+            self._raise_for_status(resp, body.decode(resp.charset or 'utf-8',
+                                                     'replace'))
+        try:
+            return self._json_loads(body)
+        except ValueError:
+            raise FoobotClient.InvalidData()
+
+    async def _iter_datapoints(self, path, batch_size,
+                               priority=PRIORITY_INTERACTIVE, **kwargs):
+        if self._rate_limiter is not None:
+            await self._rate_limiter.acquire(priority)
+        endpoint = _endpoint(path)
+        started = time.monotonic()
+        try:
+            async with async_timeout.timeout(self._timeout):
+                resp = await self._client_session().get(
+                        path, headers=dict(self._headers, **kwargs))
+        except asyncio.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.observe_timeout(endpoint)
+            raise
+        received = time.monotonic()
+        self._track_quota(resp)
+        size = 0
+        try:
+            if resp.status != 200:
+                async with async_timeout.timeout(self._timeout):
+                    resp_text = await resp.text()
+                if self._metrics is not None:
+                    self._metrics.observe_request(
+                        endpoint, resp.status, received - started,
+                        time.monotonic() - received, len(resp_text))
+                self._raise_for_status(resp, resp_text)
+            scanner = _DatapointScanner()
+            pending = []
+            final = False
+            while not final:
+                async with async_timeout.timeout(self._timeout):
+                    chunk = await resp.content.readany()
+                size += len(chunk)
+                final = not chunk
+                pending.extend(scanner.feed(chunk, final))
+                if scanner.sensors is None:
+                    continue
+                while len(pending) >= batch_size or (final and pending):
+                    yield self._parse_rows({
+                        'sensors': scanner.sensors,
+                        'datapoints': pending[:batch_size]})
+                    del pending[:batch_size]
+        except asyncio.TimeoutError:
+            if self._metrics is not None:
+                self._metrics.observe_timeout(endpoint)
+            raise
+        finally:
+            resp.release()
+        if self._metrics is not None:
+            # includes the time spent by the consumer between batches
+            self._metrics.observe_request(endpoint, resp.status,
+                                          received - started,
+                                          time.monotonic() - received, size)
+
+    def _track_quota(self, resp):
+        remaining = resp.headers.get('X-API-KEY-LIMIT-REMAINING')
+        if remaining is not None and remaining.isdigit():
+            self.quota_remaining = int(remaining)
+        if resp.status == 429:
+            retry_after = _parse_retry_after(resp.headers.get('Retry-After'))
+            self.throttled_until = time.monotonic() + (
+                THROTTLE_DELAY if retry_after is None else retry_after)
+        elif resp.status == 200:
+            self.throttled_until = None
+
+    @staticmethod
+    def _raise_for_status(resp, text):
+        if resp.status == 200:
+            return
+        elif resp.status == 400:
+            error = FoobotClient.BadFormat(text)
+        elif resp.status == 401:
+            error = FoobotClient.AuthFailure(text)
+        elif resp.status == 403:
+            error = FoobotClient.ForbiddenAccess(text)
+        elif resp.status == 429:
+            error = FoobotClient.TooManyRequests(text)
+        elif resp.status == 500:
+            error = FoobotClient.InternalError(text)
+        else:
+            error = FoobotClient.ClientError(text)
+        error.retry_after = _parse_retry_after(
+            resp.headers.get('Retry-After'))
+        raise error
 
     class ClientError(Exception):
         """Generic Error."""
-        pass
+        #: seconds to wait before retrying as requested by the server, or None
+        retry_after = None
 
     class AuthFailure(ClientError):
         """Failed Authentication."""
@@ -200,3 +959,116 @@ class FoobotClient():
     class InvalidData(ClientError):
         """Can't parse response data."""
         pass
+
+    class CircuitOpen(ClientError):
+        """API considered down and no previous response available."""
+        pass
+
+
+def _endpoint(path):
+    """
+    Get the endpoint type of an API URL.
+    """
+    if path.endswith('/device/'):
+        return ENDPOINT_DEVICES
+    elif re.search(r'/last/\d+/$', path):
+        return ENDPOINT_LAST
+    return ENDPOINT_HISTORICAL
+
+
+def _parse_retry_after(value):
+    """
+    Convert a Retry-After header, in seconds or HTTP date, to seconds.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class _DatapointScanner():
+    """
+    Incremental parser for API datapoints responses.
+
+    Bytes are fed as they are received and the complete rows of the
+    `datapoints` array found so far are returned, without ever holding the
+    whole document. `sensors` is only known before the rows when it comes
+    first in the document.
+    """
+
+    _SENSORS = re.compile(r'"sensors"\s*:\s*')
+    _DATAPOINTS = re.compile(r'"datapoints"\s*:\s*\[')
+    _SEPARATORS = re.compile(r'[\s,]*')
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._in_rows = False
+        self._done = False
+        self.sensors = None
+
+    def feed(self, chunk, final=False):
+        """
+        Parse the next chunk of the response body.
+
+        :param chunk: next bytes of the body
+        :type chunk: bytes
+        :param final: whether this is the end of the body
+        :type final: bool
+        :returns: list of raw datapoints completed by this chunk
+        """
+        self._buffer += self._text.decode(chunk, final)
+        rows = []
+        if not self._in_rows and not self._done:
+            match = self._DATAPOINTS.search(self._buffer)
+            if match is not None:
+                self._find_sensors(self._buffer[:match.start()])
+                self._buffer = self._buffer[match.end():]
+                self._in_rows = True
+        if self._in_rows:
+            position = 0
+            while True:
+                position = self._SEPARATORS.match(self._buffer,
+                                                  position).end()
+                if position == len(self._buffer):
+                    break
+                if self._buffer[position] == ']':
+                    self._in_rows = False
+                    self._done = True
+                    position += 1
+                    break
+                try:
+                    row, position = self._json.raw_decode(self._buffer,
+                                                          position)
+                except ValueError:
+                    # incomplete row, wait for more data
+                    break
+                rows.append(row)
+            self._buffer = self._buffer[position:]
+        if self._done and self.sensors is not None:
+            self._buffer = ''
+        if final:
+            if not self._done:
+                raise FoobotClient.InvalidData()
+            if self.sensors is None:
+                self._find_sensors(self._buffer)
+            if self.sensors is None:
+                raise FoobotClient.InvalidData()
+        return rows
+
+    def _find_sensors(self, text):
+        match = self._SENSORS.search(text)
+        if match is None:
+            return
+        try:
+            self.sensors = self._json.raw_decode(text, match.end())[0]
+        except ValueError:
+            raise FoobotClient.InvalidData()
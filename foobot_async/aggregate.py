@@ -0,0 +1,125 @@
+from array import array
+from math import floor, ceil
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HOURLY = 3600
+DAILY = 86400
+
+
+def aggregate(datapoints, average_by, statistic='mean'):
+    """
+    Aggregate datapoints over fixed time windows, locally.
+
+    Windows are aligned on multiples of `average_by` since the epoch, the
+    time of each aggregated datapoint being the start of its window. The
+    result uses the same field names and format as the input, so raw
+    5 minutes datapoints can be shown at any zoom level without new API
+    requests.
+
+    :param datapoints: datapoints as returned by
+        :func:`FoobotClient.parse_data`, in any of its output formats
+    :type datapoints: list or dict
+    :param average_by: seconds to aggregate data over, e.g. `HOURLY` or
+        `DAILY`
+    :type average_by: integer
+    :param statistic: 'mean', 'min', 'max' or a percentile such as 'p95'
+    :type statistic: str
+    :returns: aggregated datapoints, in the same format as `datapoints`
+    :raises: ValueError for an unknown statistic
+
+    .. note::
+        Columns given as numpy arrays are aggregated with vectorized numpy
+        operations.
+    """
+    if average_by <= 0:
+        raise ValueError("average_by must be positive")
+    reduce = _statistic(statistic)
+    if isinstance(datapoints, dict):
+        if numpy is not None and isinstance(datapoints.get('time'),
+                                            numpy.ndarray):
+            return _aggregate_numpy(datapoints, average_by, statistic)
+        columns = datapoints
+    else:
+        sensors = list(datapoints[0]) if datapoints else ['time']
+        columns = {sensor: [datapoint[sensor] for datapoint in datapoints]
+                   for sensor in sensors}
+
+    times = columns['time']
+    order = sorted(range(len(times)), key=times.__getitem__)
+    windows = []
+    groups = []
+    for index in order:
+        window = times[index] - times[index] % average_by
+        if not windows or windows[-1] != window:
+            windows.append(window)
+            groups.append([])
+        groups[-1].append(index)
+    aggregated = {'time': windows}
+    for sensor, values in columns.items():
+        if sensor != 'time':
+            aggregated[sensor] = [reduce([values[index] for index in group])
+                                  for group in groups]
+
+    if isinstance(datapoints, dict):
+        return {sensor: array('q' if sensor == 'time' else 'd', values)
+                for sensor, values in aggregated.items()}
+    return [{sensor: aggregated[sensor][index] for sensor in columns}
+            for index in range(len(windows))]
+
+
+def _statistic(name):
+    if name == 'mean':
+        return lambda values: sum(values) / len(values)
+    elif name == 'min':
+        return min
+    elif name == 'max':
+        return max
+    percent = _percent(name)
+    return lambda values: _percentile(sorted(values), percent)
+
+
+def _percent(name):
+    try:
+        percent = float(name[1:]) if name.startswith('p') else None
+    except ValueError:
+        percent = None
+    if percent is None or not 0 <= percent <= 100:
+        raise ValueError("Unknown statistic: {}".format(name))
+    return percent
+
+
+def _percentile(values, percent):
+    # linear interpolation between closest ranks, as numpy does by default
+    rank = (len(values) - 1) * percent / 100
+    low, high = floor(rank), ceil(rank)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def _aggregate_numpy(columns, average_by, statistic):
+    if not len(columns['time']):
+        return dict(columns)
+    order = numpy.argsort(columns['time'], kind='stable')
+    times = columns['time'][order]
+    windows, starts = numpy.unique(times - times % average_by,
+                                   return_index=True)
+    aggregated = {'time': windows}
+    for sensor, column in columns.items():
+        if sensor == 'time':
+            continue
+        values = column[order]
+        if statistic == 'mean':
+            aggregated[sensor] = numpy.add.reduceat(values, starts) \
+                / numpy.diff(numpy.append(starts, len(values)))
+        elif statistic == 'min':
+            aggregated[sensor] = numpy.minimum.reduceat(values, starts)
+        elif statistic == 'max':
+            aggregated[sensor] = numpy.maximum.reduceat(values, starts)
+        else:
+            aggregated[sensor] = numpy.array(
+                [numpy.percentile(group, _percent(statistic))
+                 for group in numpy.split(values, starts[1:])])
+    return {sensor: aggregated[sensor] for sensor in columns}
@@ -0,0 +1,371 @@
+from collections import deque, namedtuple
+
+from .aggregate import HOURLY
+
+POLLUTANTS = ('co2', 'pm', 'voc', 'allpollu')
+DEFAULT_HALFLIFE = 900
+
+Alert = namedtuple('Alert', ['uuid', 'rule', 'time', 'value', 'triggered'])
+Alert.__doc__ = """
+Change of state of an alert rule for a device
+
+`triggered` is True when the rule starts matching and False when it stops,
+`value` being the statistic that crossed the threshold.
+"""
+
+
+class EWMA():
+    """
+    Exponentially weighted moving mean and variance of a time series
+
+    Weights decay with the time elapsed between samples, so irregular or
+    missing samples are accounted for.
+
+    :param halflife: seconds after which a sample weighs half as much
+    :type halflife: float
+    """
+
+    def __init__(self, halflife=DEFAULT_HALFLIFE):
+        """
+        Creates a new :class:`EWMA` instance.
+        """
+        self._halflife = halflife
+        self._time = None
+        self.mean = None
+        self.variance = None
+
+    def update(self, time, value):
+        """
+        Add a sample.
+
+        :param time: time of the sample, in seconds
+        :type time: integer
+        :param value: value of the sample
+        :type value: float
+        """
+        if self._time is None:
+            self.mean = value
+            self.variance = 0.0
+        else:
+            alpha = 1 - 2 ** (-max(0, time - self._time) / self._halflife)
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.variance = (1 - alpha) * (self.variance + diff * increment)
+        self._time = time
+
+
+class WindowStats():
+    """
+    Mean, variance, min and max of the samples of the last `window` seconds
+
+    Each sample is added and removed once, and min and max are kept in
+    monotonic queues, so updates take constant amortized time whatever the
+    number of samples in the window.
+
+    :param window: seconds covered by the window, ending at the last sample
+    :type window: integer
+    """
+
+    def __init__(self, window=HOURLY):
+        """
+        Creates a new :class:`WindowStats` instance.
+        """
+        self._window = window
+        self._samples = deque()
+        self._minimums = deque()
+        self._maximums = deque()
+        # sums are taken relative to the first sample to limit rounding
+        # errors in the variance
+        self._shift = None
+        self._sum = 0.0
+        self._squares = 0.0
+
+    @property
+    def count(self):
+        """
+        Number of samples in the window.
+        """
+        return len(self._samples)
+
+    @property
+    def mean(self):
+        """
+        Mean of the samples in the window, or None if empty.
+        """
+        if not self._samples:
+            return None
+        return self._shift + self._sum / len(self._samples)
+
+    @property
+    def variance(self):
+        """
+        Population variance of the samples in the window, or None if empty.
+        """
+        if not self._samples:
+            return None
+        count = len(self._samples)
+        return max(0.0, (self._squares - self._sum ** 2 / count) / count)
+
+    @property
+    def min(self):
+        """
+        Smallest sample in the window, or None if empty.
+        """
+        return self._minimums[0][1] if self._minimums else None
+
+    @property
+    def max(self):
+        """
+        Largest sample in the window, or None if empty.
+        """
+        return self._maximums[0][1] if self._maximums else None
+
+    def update(self, time, value):
+        """
+        Add a sample, dropping the ones that are now out of the window.
+
+        :param time: time of the sample, in seconds, not older than the
+            previous one
+        :type time: integer
+        :param value: value of the sample
+        :type value: float
+        """
+        if self._shift is None:
+            self._shift = value
+        self._samples.append((time, value))
+        self._sum += value - self._shift
+        self._squares += (value - self._shift) ** 2
+        while self._minimums and self._minimums[-1][1] >= value:
+            self._minimums.pop()
+        self._minimums.append((time, value))
+        while self._maximums and self._maximums[-1][1] <= value:
+            self._maximums.pop()
+        self._maximums.append((time, value))
+
+        start = time - self._window
+        while self._samples[0][0] <= start:
+            _, old = self._samples.popleft()
+            self._sum -= old - self._shift
+            self._squares -= (old - self._shift) ** 2
+        while self._minimums[0][0] <= start:
+            self._minimums.popleft()
+        while self._maximums[0][0] <= start:
+            self._maximums.popleft()
+
+
+class AlertRule():
+    """
+    Threshold on a rolling statistic of a sensor
+
+    :param name: name of the rule, reported in alerts
+    :type name: str
+    :param sensor: field name of the sensor, as produced by
+        :func:`FoobotClient.parse_data`
+    :type sensor: str
+    :param threshold: value the statistic is compared to
+    :type threshold: float
+    :param statistic: 'value' for the last sample, 'mean', 'min', 'max' or
+        'variance' over the window, 'ewma' or 'ewmvar' for the exponentially
+        weighted mean and variance
+    :type statistic: str
+    :param below: match when the statistic is below the threshold instead of
+        above it
+    :type below: bool
+    """
+
+    def __init__(self, name, sensor, threshold, statistic='value',
+                 below=False):
+        """
+        Creates a new :class:`AlertRule` instance.
+        """
+        if statistic not in _STATISTICS:
+            raise ValueError("Unknown statistic: {}".format(statistic))
+        self.name = name
+        self.sensor = sensor
+        self.threshold = threshold
+        self.statistic = statistic
+        self.below = below
+
+    def __repr__(self):
+        return '<AlertRule {} {} {} {} {}>'.format(
+            self.name, self.statistic, self.sensor,
+            '<' if self.below else '>', self.threshold)
+
+    def matches(self, value):
+        """
+        Check a statistic against the threshold.
+
+        :param value: value of the statistic
+        :type value: float
+        :returns: bool
+        """
+        if value is None:
+            return False
+        return value < self.threshold if self.below \
+            else value > self.threshold
+
+
+class RollingAnalytics():
+    """
+    Rolling statistics and threshold alerts per device and sensor, updated
+    as datapoints arrive
+
+    Every datapoint updates the statistics of its sensors in constant time,
+    and alert rules are only evaluated on the statistics they use, so the
+    cost of new data doesn't depend on the length of the history.
+
+    :param sensors: field names of the sensors to follow
+    :type sensors: iterable of str
+    :param window: seconds covered by the fixed window statistics
+    :type window: integer
+    :param halflife: half-life of the exponentially weighted statistics, in
+        seconds
+    :type halflife: float
+    :param rules: alert rules to evaluate
+    :type rules: iterable of AlertRule
+
+    .. note::
+        Results of :class:`DeviceWatcher` can be fed directly:
+
+        .. code-block:: python
+
+            analytics = RollingAnalytics(rules=[
+                AlertRule('co2', 'co2', 1300, statistic='mean')])
+            async for uuid, datapoints in watcher:
+                if not isinstance(datapoints, Exception):
+                    for alert in analytics.update(uuid, datapoints):
+                        ...
+    """
+
+    def __init__(self, sensors=POLLUTANTS, window=HOURLY,
+                 halflife=DEFAULT_HALFLIFE, rules=()):
+        """
+        Creates a new :class:`RollingAnalytics` instance.
+        """
+        self._sensors = tuple(sensors)
+        self._window = window
+        self._halflife = halflife
+        self._rules = list(rules)
+        for rule in self._rules:
+            if rule.statistic != 'value' and rule.sensor not in self._sensors:
+                raise ValueError("Sensor not followed: {}".format(
+                    rule.sensor))
+        self._series = {}
+        self._last_times = {}
+        self._active = {}
+
+    def update(self, uuid, datapoints):
+        """
+        Add new datapoints of a device.
+
+        Datapoints not newer than the last one seen for that device are
+        ignored, so overlapping results can be given.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param datapoints: datapoints as returned by
+            :func:`FoobotClient.parse_data`, rows or columns
+        :type datapoints: list or dict
+        :returns: list of :class:`Alert`, for rules that started or stopped
+            matching
+        """
+        if isinstance(datapoints, dict):
+            columns = datapoints
+            datapoints = [{sensor: columns[sensor][index]
+                           for sensor in columns}
+                          for index in range(len(columns['time']))]
+        series = self._series.get(uuid)
+        if series is None:
+            series = self._series[uuid] = {
+                sensor: (WindowStats(self._window), EWMA(self._halflife))
+                for sensor in self._sensors}
+            self._active[uuid] = set()
+        alerts = []
+        last_time = self._last_times.get(uuid)
+        for datapoint in sorted(datapoints,
+                                key=lambda datapoint: datapoint['time']):
+            time = datapoint['time']
+            if last_time is not None and time <= last_time:
+                continue
+            last_time = time
+            for sensor in self._sensors:
+                value = datapoint.get(sensor)
+                if value is None or value != value:
+                    continue
+                window, ewma = series[sensor]
+                window.update(time, value)
+                ewma.update(time, value)
+            alerts.extend(self._evaluate(uuid, datapoint, series))
+        self._last_times[uuid] = last_time
+        return alerts
+
+    def stats(self, uuid, sensor):
+        """
+        Get the current statistics of a sensor of a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param sensor: field name of the sensor
+        :type sensor: str
+        :returns: dictionnary with `count`, `mean`, `variance`, `min`, `max`
+            over the window and `ewma`, `ewmvar`, or None for an unknown
+            device
+        """
+        series = self._series.get(uuid)
+        if series is None:
+            return None
+        window, ewma = series[sensor]
+        return dict(count=window.count, mean=window.mean,
+                    variance=window.variance, min=window.min, max=window.max,
+                    ewma=ewma.mean, ewmvar=ewma.variance)
+
+    def active(self, uuid):
+        """
+        Get the names of the rules currently matching for a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :returns: set of str
+        """
+        return {rule.name for rule in self._active.get(uuid, ())}
+
+    def remove(self, uuid):
+        """
+        Forget the statistics and alerts of a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        """
+        self._series.pop(uuid, None)
+        self._last_times.pop(uuid, None)
+        self._active.pop(uuid, None)
+
+    def _evaluate(self, uuid, datapoint, series):
+        alerts = []
+        active = self._active[uuid]
+        for rule in self._rules:
+            if rule.statistic == 'value':
+                value = datapoint.get(rule.sensor)
+            else:
+                value = _STATISTICS[rule.statistic](*series[rule.sensor])
+            matches = rule.matches(value)
+            if matches != (rule in active):
+                if matches:
+                    active.add(rule)
+                else:
+                    active.discard(rule)
+                alerts.append(Alert(uuid, rule, datapoint['time'], value,
+                                    matches))
+        return alerts
+
+
+_STATISTICS = {
+    'value': None,
+    'mean': lambda window, ewma: window.mean,
+    'variance': lambda window, ewma: window.variance,
+    'min': lambda window, ewma: window.min,
+    'max': lambda window, ewma: window.max,
+    'ewma': lambda window, ewma: ewma.mean,
+    'ewmvar': lambda window, ewma: ewma.variance,
+}
@@ -0,0 +1,107 @@
+import time
+
+
+class CircuitBreaker():
+    """
+    Circuit breaker tripping after repeated failures
+
+    Once open, requests are refused until `reset_timeout` has elapsed, then a
+    single trial request is allowed: its success closes the breaker, its
+    failure opens it again.
+
+    :param failure_threshold: consecutive failures opening the breaker
+    :type failure_threshold: integer
+    :param reset_timeout: seconds to wait before allowing a trial request
+    :type reset_timeout: float
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Creates a new :class:`CircuitBreaker` instance.
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    @property
+    def closed(self):
+        """
+        Whether requests are let through normally.
+        """
+        return self._opened_at is None
+
+    def allow(self):
+        """
+        Check whether a request can be made, taking the trial request slot
+        if the breaker is open and its reset timeout has elapsed.
+
+        :returns: bool
+        """
+        if self._opened_at is None:
+            return True
+        if self._trial or \
+                time.monotonic() - self._opened_at < self._reset_timeout:
+            return False
+        self._trial = True
+        return True
+
+    def release(self):
+        """
+        Give back the trial request slot, e.g. when the trial request was
+        cancelled before getting an answer.
+        """
+        self._trial = False
+
+    def record_success(self):
+        """
+        Record a successful request, closing the breaker.
+        """
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        """
+        Record a failed request, opening the breaker after too many of them
+        or after a failed trial.
+        """
+        self._failures += 1
+        if self._trial or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+
+class StaleList(list):
+    """
+    List result served from the last good response.
+
+    :ivar age: seconds since that response was received
+    """
+    age = None
+
+
+class StaleDict(dict):
+    """
+    Dictionnary result served from the last good response.
+
+    :ivar age: seconds since that response was received
+    """
+    age = None
+
+
+def mark_stale(result, age):
+    """
+    Wrap a result to flag it as stale.
+
+    :param result: result to flag
+    :type result: list or dict
+    :param age: seconds since the result was received
+    :type age: float
+    :returns: StaleList or StaleDict
+    """
+    stale = StaleList(result) if isinstance(result, list) \
+        else StaleDict(result)
+    stale.age = age
+    return stale
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import time
+
+ENDPOINT_DEVICES = 'devices'
+ENDPOINT_LAST = 'last'
+ENDPOINT_HISTORICAL = 'historical'
+
+DEFAULT_TTL = {ENDPOINT_DEVICES: 3600,
+               ENDPOINT_LAST: 60,
+               ENDPOINT_HISTORICAL: 300}
+
+
+class ResponseCache():
+    """
+    Bounded LRU cache of API responses with per-endpoint expiration
+
+    :param maxsize: maximum number of responses kept, the least recently used
+        ones are evicted first
+    :type maxsize: integer
+    :param ttl: seconds responses are kept for, by endpoint type
+        ('devices', 'last' or 'historical'), None to never expire them.
+        Endpoints types not given use `DEFAULT_TTL`.
+    :type ttl: dict or None
+
+    .. note::
+        Cached responses are shared between callers and must not be
+        modified.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        """
+        Creates a new :class:`ResponseCache` instance.
+        """
+        self._maxsize = maxsize
+        self._ttl = dict(DEFAULT_TTL, **(ttl or {}))
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Get a response from the cache.
+
+        :param key: request URL
+        :type key: str
+        :returns: the cached response or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None \
+                and entry[1] <= time.monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, endpoint, immutable=False):
+        """
+        Add a response to the cache.
+
+        :param key: request URL
+        :type key: str
+        :param value: decoded response
+        :type value: object
+        :param endpoint: endpoint type, used to pick the expiration delay
+        :type endpoint: str
+        :param immutable: never expire this response, e.g. for data ranges
+            that are fully in the past
+        :type immutable: bool
+        """
+        ttl = None if immutable else self._ttl.get(endpoint)
+        expires = None if ttl is None else time.monotonic() + ttl
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """
+        Remove every response from the cache.
+        """
+        self._entries.clear()
+
+    def stats(self):
+        """
+        Get the cache counters.
+
+        :returns: dictionnary with hits, misses, evictions and size
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, size=len(self._entries))
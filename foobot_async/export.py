@@ -0,0 +1,172 @@
+from datetime import datetime, timezone, timedelta
+from math import trunc
+import asyncio
+import csv
+import os
+
+from . import SENSORS, DEFAULT_BATCH_SIZE
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+DEFAULT_WINDOW = timedelta(days=1)
+
+
+async def export(client, uuids, start, end, directory, format=FORMAT_CSV,
+                 window=DEFAULT_WINDOW, average_by=0,
+                 batch_size=DEFAULT_BATCH_SIZE, concurrency=1):
+    """
+    Export the datapoints of devices to files, one per device and window.
+
+    Datapoints are streamed from the API and written batch by batch, so
+    memory use is bounded by `batch_size` whatever the length of the range.
+    Each window is written to a temporary file renamed once complete: an
+    interrupted export can be resumed by running it again, windows already
+    exported being skipped.
+
+    :param client: client used to download the datapoints
+    :type client: FoobotClient
+    :param uuids: Ids of the devices
+    :type uuids: iterable of str
+    :param start: start of the range
+    :type start: datetime
+    :param end: end of the range
+    :type end: datetime
+    :param directory: directory to write to, with one subdirectory per device
+    :type directory: str
+    :param format: `FORMAT_CSV`, or `FORMAT_PARQUET` and `FORMAT_ARROW`
+        (Arrow IPC file) which require pyarrow
+    :type format: str
+    :param window: time range covered by each file
+    :type window: timedelta
+    :param average_by: amount of seconds to average data over.
+    :type average_by: integer
+    :param batch_size: datapoints per batch, which is also the Parquet row
+        group and Arrow record batch size
+    :type batch_size: integer
+    :param concurrency: number of devices exported at the same time
+    :type concurrency: integer
+    :returns: list of the files written by this call
+    :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
+             TooManyRequests, InternalError
+
+    .. note::
+        Files are named after their window as `<start>-<end>.<format>` with
+        UTC timestamps. Windows include their start and exclude their end,
+        except for the last one which ends at `end`.
+    """
+    if format not in _WRITERS:
+        raise ValueError("Unknown format: {}".format(format))
+    if format != FORMAT_CSV and pyarrow is None:
+        raise ImportError("pyarrow is required for {} export".format(format))
+    start = trunc(start.replace(tzinfo=timezone.utc).timestamp())
+    end = trunc(end.replace(tzinfo=timezone.utc).timestamp())
+    step = trunc(window.total_seconds())
+    windows = [(window_start, min(window_start + step, end))
+               for window_start in range(start, end, step)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def export_device(uuid):
+        written = []
+        async with semaphore:
+            for window_start, window_end in windows:
+                path = os.path.join(directory, uuid, '{}-{}.{}'.format(
+                    window_start, window_end, format))
+                if os.path.exists(path):
+                    continue
+                await _export_window(client, uuid, window_start, window_end,
+                                     window_end == end, path, format,
+                                     average_by, batch_size)
+                written.append(path)
+        return written
+
+    results = await asyncio.gather(*[export_device(uuid) for uuid in uuids])
+    return [path for written in results for path in written]
+
+
+async def _export_window(client, uuid, start, end, last, path, format,
+                         average_by, batch_size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.part'
+    writer = _WRITERS[format](partial)
+    try:
+        async for batch in client.iter_historical_data(
+                uuid, datetime.utcfromtimestamp(start),
+                datetime.utcfromtimestamp(end), average_by, batch_size):
+            if not last:
+                batch = [datapoint for datapoint in batch
+                         if datapoint['time'] < end]
+            if batch:
+                writer.write(batch)
+        writer.close()
+    except BaseException:
+        writer.close()
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+
+
+class _CSVWriter():
+
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='')
+        self._writer = None
+
+    def write(self, batch):
+        if self._writer is None:
+            self._writer = csv.DictWriter(self._file,
+                                          fieldnames=list(batch[0]))
+            self._writer.writeheader()
+        self._writer.writerows(batch)
+
+    def close(self):
+        self._file.close()
+
+
+class _ArrowWriter():
+
+    def __init__(self, path):
+        self._path = path
+        self._schema = None
+        self._writer = None
+
+    def _open(self, sensors):
+        self._schema = pyarrow.schema([
+            (sensor, pyarrow.int64() if sensor == 'time'
+             else pyarrow.float64()) for sensor in sensors])
+        self._writer = self._new_writer()
+
+    def _new_writer(self):
+        return pyarrow.ipc.new_file(self._path, self._schema)
+
+    def write(self, batch):
+        if self._writer is None:
+            self._open(list(batch[0]))
+        self._writer.write_table(pyarrow.Table.from_pydict(
+            {sensor: [datapoint.get(sensor) for datapoint in batch]
+             for sensor in self._schema.names},
+            schema=self._schema))
+
+    def close(self):
+        if self._writer is None:
+            # empty window, still write a valid file
+            self._open(SENSORS)
+        self._writer.close()
+
+
+class _ParquetWriter(_ArrowWriter):
+
+    def _new_writer(self):
+        return pyarrow.parquet.ParquetWriter(self._path, self._schema)
+
+
+_WRITERS = {FORMAT_CSV: _CSVWriter,
+            FORMAT_PARQUET: _ParquetWriter,
+            FORMAT_ARROW: _ArrowWriter}
@@ -0,0 +1,48 @@
+from collections import defaultdict, deque
+
+
+class LatencyTracker():
+    """
+    Rolling window of observed request latencies, by endpoint type
+
+    :param window: number of most recent latencies kept per endpoint type
+    :type window: integer
+    :param min_samples: number of latencies needed before percentiles are
+        reported
+    :type min_samples: integer
+    """
+
+    def __init__(self, window=200, min_samples=20):
+        """
+        Creates a new :class:`LatencyTracker` instance.
+        """
+        self._min_samples = min_samples
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def observe(self, endpoint, seconds):
+        """
+        Record the latency of a request.
+
+        :param endpoint: endpoint type
+        :type endpoint: str
+        :param seconds: latency of the request
+        :type seconds: float
+        """
+        self._samples[endpoint].append(seconds)
+
+    def percentile(self, endpoint, percent):
+        """
+        Get a percentile of the recent latencies of an endpoint type.
+
+        :param endpoint: endpoint type
+        :type endpoint: str
+        :param percent: percentile to compute, e.g. 95
+        :type percent: float
+        :returns: latency in seconds, or None without enough samples
+        """
+        samples = self._samples.get(endpoint)
+        if samples is None or len(samples) < self._min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1,
+                           int(len(ordered) * percent / 100))]
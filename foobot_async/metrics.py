@@ -0,0 +1,208 @@
+from bisect import bisect_left
+from collections import defaultdict
+
+DEFAULT_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                           30)
+DEFAULT_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576,
+                        4194304, 16777216)
+
+
+class Histogram():
+    """
+    Cumulative histogram with fixed upper bounds
+
+    :param buckets: upper bounds of the buckets
+    :type buckets: iterable of float
+    """
+
+    def __init__(self, buckets):
+        """
+        Creates a new :class:`Histogram` instance.
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Record a value.
+
+        :param value: value to record
+        :type value: float
+        """
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        Get the number of values lower or equal to each bucket bound.
+
+        :returns: list of (upper bound, count), the last bound being infinity
+        """
+        counts = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self._counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+    def snapshot(self):
+        """
+        :returns: dictionnary with buckets, sum and count
+        """
+        return dict(buckets=self.cumulative_counts(), sum=self.sum,
+                    count=self.count)
+
+
+class Metrics():
+    """
+    Collector of :class:`FoobotClient` requests metrics, by endpoint type
+    ('devices', 'last' or 'historical')
+
+    Any object with the same `observe_request`, `observe_timeout` and
+    `observe_parse` methods can be given to the client instead, e.g. to
+    forward measures to an existing monitoring system.
+
+    :param latency_buckets: upper bounds in seconds of the latency histograms
+    :type latency_buckets: iterable of float
+    :param size_buckets: upper bounds in bytes of the response size histogram
+    :type size_buckets: iterable of integer
+    """
+
+    def __init__(self, latency_buckets=DEFAULT_LATENCY_BUCKETS,
+                 size_buckets=DEFAULT_SIZE_BUCKETS):
+        """
+        Creates a new :class:`Metrics` instance.
+        """
+        self._latency_buckets = latency_buckets
+        self._size_buckets = size_buckets
+        self._endpoints = defaultdict(self._new_endpoint)
+
+    def _new_endpoint(self):
+        return dict(headers_seconds=Histogram(self._latency_buckets),
+                    body_seconds=Histogram(self._latency_buckets),
+                    response_bytes=Histogram(self._size_buckets),
+                    parse_seconds=Histogram(self._latency_buckets),
+                    statuses=defaultdict(int),
+                    timeouts=0,
+                    parsed_rows=0)
+
+    def observe_request(self, endpoint, status, headers_seconds,
+                        body_seconds, size):
+        """
+        Record a completed request.
+
+        :param endpoint: endpoint type
+        :type endpoint: str
+        :param status: HTTP status code
+        :type status: integer
+        :param headers_seconds: time until the response headers were received
+        :type headers_seconds: float
+        :param body_seconds: time spent downloading the response body
+        :type body_seconds: float
+        :param size: size of the response body in bytes
+        :type size: integer
+        """
+        metrics = self._endpoints[endpoint]
+        metrics['headers_seconds'].observe(headers_seconds)
+        metrics['body_seconds'].observe(body_seconds)
+        metrics['response_bytes'].observe(size)
+        metrics['statuses'][status] += 1
+
+    def observe_timeout(self, endpoint):
+        """
+        Record a request that timed out.
+
+        :param endpoint: endpoint type
+        :type endpoint: str
+        """
+        self._endpoints[endpoint]['timeouts'] += 1
+
+    def observe_parse(self, endpoint, seconds, rows):
+        """
+        Record the parsing of a response.
+
+        :param endpoint: endpoint type
+        :type endpoint: str
+        :param seconds: time spent parsing
+        :type seconds: float
+        :param rows: number of datapoints parsed
+        :type rows: integer
+        """
+        metrics = self._endpoints[endpoint]
+        metrics['parse_seconds'].observe(seconds)
+        metrics['parsed_rows'] += rows
+
+    def snapshot(self):
+        """
+        Get the current state of all metrics.
+
+        :returns: dictionnary of metrics by endpoint type
+        """
+        snapshot = {}
+        for endpoint, metrics in self._endpoints.items():
+            snapshot[endpoint] = {
+                name: (value.snapshot() if isinstance(value, Histogram)
+                       else dict(value) if isinstance(value, dict)
+                       else value)
+                for name, value in metrics.items()}
+        return snapshot
+
+    def to_prometheus(self, prefix='foobot'):
+        """
+        Export all metrics in Prometheus text exposition format.
+
+        :param prefix: prefix of the metric names
+        :type prefix: str
+        :returns: str
+        """
+        lines = []
+
+        def histogram(name, description, values):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+            lines.append('# TYPE {}_{} histogram'.format(prefix, name))
+            for labels, value in values:
+                for bound, count in value.cumulative_counts():
+                    lines.append('{}_{}_bucket{{{},le="{}"}} {}'.format(
+                        prefix, name, labels,
+                        '+Inf' if bound == float('inf') else bound, count))
+                lines.append('{}_{}_sum{{{}}} {}'.format(
+                    prefix, name, labels, value.sum))
+                lines.append('{}_{}_count{{{}}} {}'.format(
+                    prefix, name, labels, value.count))
+
+        def counter(name, description, values):
+            lines.append('# HELP {}_{} {}'.format(prefix, name, description))
+            lines.append('# TYPE {}_{} counter'.format(prefix, name))
+            for labels, value in values:
+                lines.append('{}_{}{{{}}} {}'.format(prefix, name, labels,
+                                                     value))
+
+        endpoints = sorted(self._endpoints.items())
+        histogram('request_duration_seconds', 'Request latency by phase.',
+                  [('endpoint="{}",phase="{}"'.format(endpoint, phase),
+                    metrics[phase + '_seconds'])
+                   for endpoint, metrics in endpoints
+                   for phase in ('headers', 'body')])
+        histogram('response_size_bytes', 'Response body size.',
+                  [('endpoint="{}"'.format(endpoint),
+                    metrics['response_bytes'])
+                   for endpoint, metrics in endpoints])
+        counter('responses_total', 'Responses by HTTP status code.',
+                [('endpoint="{}",status="{}"'.format(endpoint, status), count)
+                 for endpoint, metrics in endpoints
+                 for status, count in sorted(metrics['statuses'].items())])
+        counter('timeouts_total', 'Requests that timed out.',
+                [('endpoint="{}"'.format(endpoint), metrics['timeouts'])
+                 for endpoint, metrics in endpoints])
+        histogram('parse_duration_seconds', 'Datapoints parsing time.',
+                  [('endpoint="{}"'.format(endpoint),
+                    metrics['parse_seconds'])
+                   for endpoint, metrics in endpoints])
+        counter('parsed_rows_total', 'Datapoints parsed.',
+                [('endpoint="{}"'.format(endpoint), metrics['parsed_rows'])
+                 for endpoint, metrics in endpoints])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,208 @@
+from datetime import datetime, timezone
+from math import gcd, trunc
+import asyncio
+
+import aiohttp
+
+from . import FoobotClient, DEFAULT_CONCURRENCY, MAX_HISTORICAL_RANGE, \
+    SENSORS
+from .aggregate import HOURLY, DAILY
+from .ratelimit import PRIORITY_BULK
+from .watch import SAMPLE_INTERVAL
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAX_WINDOW = trunc(MAX_HISTORICAL_RANGE.total_seconds())
+WINDOWS = (HOURLY, DAILY, MAX_WINDOW)
+MAX_WINDOWS = 8
+
+
+def plan(start, end, average_by=0, window=None):
+    """
+    Plan the requests of a time range as aligned, cacheable windows.
+
+    The range is widened to whole windows aligned on multiples of `window`
+    since the epoch, so that requests start and end on the hour, as the API
+    prefers, and overlapping queries share the same cached responses.
+
+    By default the window is chosen from the length of the range: the
+    smallest of `WINDOWS` covering it in at most `MAX_WINDOWS` requests, so
+    short ranges aren't widened to days of data, and long ranges need as
+    few requests as with :func:`FoobotClient.get_historical_data`. Only
+    queries planned with the same window share cached responses.
+
+    :param start: start of the range, UTC timestamp
+    :type start: integer
+    :param end: end of the range, UTC timestamp
+    :type end: integer
+    :param average_by: amount of seconds to average data over
+    :type average_by: integer
+    :param window: seconds covered by each request, rounded down to a
+        multiple of one hour and of `average_by`, which is the minimum,
+        or None to choose it from the range
+    :type window: integer or None
+    :returns: list of (window start, window end) UTC timestamps
+    """
+    step = HOURLY
+    if average_by > 0:
+        step = HOURLY * average_by // gcd(HOURLY, average_by)
+    if window is None:
+        for window in WINDOWS:
+            window = step * max(1, window // step)
+            if end // window - start // window < MAX_WINDOWS:
+                break
+    window = step * max(1, window // step)
+    first = start - start % window
+    return [(window_start, window_start + window)
+            for window_start in range(first, max(end, first + 1), window)]
+
+
+class FleetMatrix():
+    """
+    Datapoints of several devices aligned on a common time grid
+
+    `values[device][bucket][sensor]` is the datapoint of a device in a time
+    bucket, indexed like `uuids`, `times` and `sensors`. Gaps, such as
+    missing samples or devices whose requests failed, are None.
+
+    :ivar uuids: Ids of the devices
+    :ivar times: start of each time bucket, UTC timestamps
+    :ivar sensors: field names of the sensors
+    :ivar values: nested lists of sensor values or None
+    :ivar errors: exception by uuid, for devices whose requests failed
+    """
+
+    def __init__(self, uuids, times, sensors, values, errors):
+        """
+        Creates a new :class:`FleetMatrix` instance.
+        """
+        self.uuids = uuids
+        self.times = times
+        self.sensors = sensors
+        self.values = values
+        self.errors = errors
+
+    def series(self, uuid, sensor):
+        """
+        Get the values of a sensor of a device over time.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param sensor: field name of the sensor
+        :type sensor: str
+        :returns: list of values or None, one per time bucket
+        """
+        column = self.sensors.index(sensor)
+        return [bucket[column]
+                for bucket in self.values[self.uuids.index(uuid)]]
+
+    def to_numpy(self):
+        """
+        Get the matrix as a numpy array, gaps being NaN.
+
+        :returns: float array of shape (devices, time buckets, sensors)
+        :raises: ImportError if numpy is not installed
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for numpy output")
+        return numpy.array(self.values, dtype=float).reshape(
+            len(self.uuids), len(self.times), len(self.sensors))
+
+
+async def fetch_matrix(client, uuids, start, end, average_by=0,
+                       sensors=None, window=None,
+                       concurrency=DEFAULT_CONCURRENCY,
+                       priority=PRIORITY_BULK):
+    """
+    Get the data of several devices for a time range as a
+    :class:`FleetMatrix`.
+
+    Requests are planned with :func:`plan`: aligned windows are fetched
+    concurrently across devices, at most `concurrency` at a time, then the
+    datapoints are trimmed to the range and placed in time buckets of
+    `average_by` seconds, or of the sample interval without averaging.
+
+    :param client: client used to download the datapoints, with a
+        :class:`ResponseCache` to reuse windows between queries
+    :type client: FoobotClient
+    :param uuids: Ids of the devices
+    :type uuids: iterable of str
+    :param start: start of the range
+    :type start: datetime
+    :param end: end of the range
+    :type end: datetime
+    :param average_by: amount of seconds to average data over
+    :type average_by: integer
+    :param sensors: field names of the sensors to keep, all of them by
+        default
+    :type sensors: list of str or None
+    :param window: seconds covered by each request, chosen from the range
+        by default, see :func:`plan`
+    :type window: integer or None
+    :param concurrency: maximum number of requests in flight
+    :type concurrency: integer
+    :param priority: rate limiter priority, lower is served first
+    :type priority: integer
+    :returns: FleetMatrix
+
+    .. note::
+        A failing device does not stop the others: its exception is
+        recorded in `errors` and its row is left empty.
+    """
+    uuids = list(uuids)
+    start = trunc(start.replace(tzinfo=timezone.utc).timestamp())
+    end = trunc(end.replace(tzinfo=timezone.utc).timestamp())
+    average_by = trunc(average_by)
+    bucket = average_by if average_by > 0 else SAMPLE_INTERVAL
+    windows = plan(start, end, average_by, window)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(uuid, window_start, window_end):
+        async with semaphore:
+            return (await client.get_historical_data(
+                uuid, datetime.utcfromtimestamp(window_start),
+                datetime.utcfromtimestamp(window_end), average_by,
+                priority=priority))
+
+    async def fetch_device(uuid):
+        results = await asyncio.gather(*[
+            fetch(uuid, window_start, window_end)
+            for window_start, window_end in windows], return_exceptions=True)
+        for result in results:
+            if isinstance(result, (FoobotClient.ClientError,
+                                   aiohttp.ClientError,
+                                   asyncio.TimeoutError)):
+                return result
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    results = await asyncio.gather(*[fetch_device(uuid) for uuid in uuids])
+
+    first = start - start % bucket
+    times = list(range(first, end - end % bucket + 1, bucket))
+    if sensors is None:
+        sensors = next((
+            [sensor for sensor in datapoints[0] if sensor != 'time']
+            for result in results if not isinstance(result, Exception)
+            for datapoints in result if datapoints), list(SENSORS[1:]))
+    errors = {}
+    values = []
+    for uuid, result in zip(uuids, results):
+        buckets = [None] * len(times)
+        if isinstance(result, Exception):
+            errors[uuid] = result
+            result = []
+        for datapoints in result:
+            for datapoint in datapoints:
+                if start <= datapoint['time'] <= end:
+                    buckets[(datapoint['time'] - first) // bucket] = \
+                        datapoint
+        values.append([
+            [None] * len(sensors) if datapoint is None
+            else [datapoint.get(sensor) for sensor in sensors]
+            for datapoint in buckets])
+    return FleetMatrix(uuids, times, sensors, values, errors)
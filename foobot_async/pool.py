@@ -0,0 +1,211 @@
+import asyncio
+import time
+
+import aiohttp
+
+from . import FoobotClient
+from .ratelimit import RateLimiter
+
+DEFAULT_REDISCOVER_INTERVAL = 300
+
+
+class FoobotClientPool():
+    """
+    Clients for several Foobot accounts sharing one HTTP session
+
+    Requests for a device are routed to the accounts owning it, as learned
+    from their device lists. When a device is visible from several accounts,
+    the API key with the most remaining quota and no recent 429 is used, and
+    the next one is tried if it turns out to be over quota.
+
+    :param accounts: API secret keys and usernames of the accounts
+    :type accounts: iterable of (str, str)
+    :param session: aiohttp session to use or None to create one, closed
+        with the pool
+    :type session: object or None
+    :param limit: maximum number of simultaneous connections of the pool's
+        own session
+    :type limit: integer
+    :param rediscover_interval: minimum seconds between two discoveries
+        triggered by requests for devices no account is known to own
+    :type rediscover_interval: float
+    :param rate: requests per second allowed to each account, by a
+        :class:`RateLimiter` of its own, or None for no limit
+    :type rate: float or None
+    :param burst: requests each account can make at once
+    :type burst: integer
+    :param kwargs: other :class:`FoobotClient` arguments, applied to every
+        account, except `rate_limiter` as quotas are per account
+
+    .. note::
+        The pool is an async context manager:
+
+        .. code-block:: python
+
+            async with FoobotClientPool(accounts) as pool:
+                await pool.discover()
+                datapoints = await pool.get_last_data(uuid)
+    """
+
+    def __init__(self, accounts, session=None, limit=100,
+                 rediscover_interval=DEFAULT_REDISCOVER_INTERVAL, rate=None,
+                 burst=1, **kwargs):
+        """
+        Creates a new :class:`FoobotClientPool` instance.
+        """
+        if 'rate_limiter' in kwargs:
+            raise ValueError("A rate limiter can't be shared by accounts, "
+                             "use rate and burst instead")
+        self._accounts = list(accounts)
+        self._session = session
+        self._owns_session = session is None
+        self._limit = limit
+        self._rate = rate
+        self._burst = burst
+        self._kwargs = kwargs
+        self._clients = None
+        self._owners = {}
+        self._inflight = {}
+        self._rediscover_interval = rediscover_interval
+        self._discovered = None
+        self.errors = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the session created by the pool, if any.
+
+        Clients and known owners are dropped, so the pool can still be used
+        afterwards, with a new session.
+        """
+        self._clients = None
+        self._owners = {}
+        self._inflight = {}
+        self._discovered = None
+        if self._owns_session and self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    @property
+    def clients(self):
+        """
+        Clients of every account, in the order they were given.
+        """
+        if self._clients is None:
+            if self._session is None:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self._limit))
+            self._clients = [
+                FoobotClient(token, username, session=self._session,
+                             rate_limiter=self._rate_limiter(),
+                             **self._kwargs)
+                for token, username in self._accounts]
+            self._inflight = {client: 0 for client in self._clients}
+        return self._clients
+
+    def _rate_limiter(self):
+        if self._rate is None:
+            return None
+        return RateLimiter(self._rate, self._burst)
+
+    async def discover(self):
+        """
+        Get the devices of every account and learn which accounts own them.
+
+        An account whose device list can't be fetched doesn't stop the
+        others: its error is kept in `errors`, by username, and the devices
+        it was previously known to own are still routed to it.
+
+        :returns: list of devices, each listed once
+        :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
+                 TooManyRequests, InternalError when every account failed
+
+        .. seealso:: :func:`FoobotClient.get_devices` for return data syntax
+        """
+        clients = self.clients
+        self._discovered = time.monotonic()
+        device_lists = await asyncio.gather(*[client.get_devices()
+                                              for client in clients],
+                                            return_exceptions=True)
+        owners = {}
+        devices = {}
+        errors = {}
+        for client, (token, username), device_list in zip(
+                clients, self._accounts, device_lists):
+            if isinstance(device_list, (FoobotClient.ClientError,
+                                        aiohttp.ClientError,
+                                        asyncio.TimeoutError)):
+                errors[username] = device_list
+                for uuid, uuid_owners in self._owners.items():
+                    if client in uuid_owners:
+                        owners.setdefault(uuid, []).append(client)
+                continue
+            if isinstance(device_list, BaseException):
+                raise device_list
+            for device in device_list:
+                owners.setdefault(device['uuid'], []).append(client)
+                devices.setdefault(device['uuid'], device)
+        self.errors = errors
+        if clients and len(errors) == len(clients):
+            raise next(iter(errors.values()))
+        self._owners = owners
+        return list(devices.values())
+
+    get_devices = discover
+
+    async def get_last_data(self, uuid, *args, **kwargs):
+        """
+        Get the data from one device for period till now, using one of the
+        accounts owning it.
+
+        .. seealso:: :func:`FoobotClient.get_last_data` for arguments and
+            return data syntax
+        """
+        return (await self._route(uuid, 'get_last_data', *args, **kwargs))
+
+    async def get_historical_data(self, uuid, *args, **kwargs):
+        """
+        Get the data from one device for a specified time range, using one
+        of the accounts owning it.
+
+        .. seealso:: :func:`FoobotClient.get_historical_data` for arguments
+            and return data syntax
+        """
+        return (await self._route(uuid, 'get_historical_data', *args,
+                                  **kwargs))
+
+    def _candidates(self, uuid):
+        now = time.monotonic()
+
+        def load(client):
+            throttled = client.throttled_until is not None \
+                and client.throttled_until > now
+            remaining = client.quota_remaining
+            return (throttled,
+                    -remaining if remaining is not None else float('-inf'),
+                    self._inflight[client])
+
+        return sorted(self._owners[uuid], key=load)
+
+    async def _route(self, uuid, method, *args, **kwargs):
+        if uuid not in self._owners and (
+                self._discovered is None or time.monotonic() >=
+                self._discovered + self._rediscover_interval):
+            await self.discover()
+        if uuid not in self._owners:
+            raise FoobotClient.ForbiddenAccess(
+                "No account owns device {}".format(uuid))
+        for client in self._candidates(uuid):
+            self._inflight[client] += 1
+            try:
+                return (await getattr(client, method)(uuid, *args, **kwargs))
+            except FoobotClient.TooManyRequests as error:
+                last_error = error
+            finally:
+                self._inflight[client] -= 1
+        raise last_error
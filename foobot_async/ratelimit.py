@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class RateLimiter():
+    """
+    Token bucket rate limiter shared by all the requests of a client
+
+    Waiting requests are served by priority (lowest value first), then in
+    arrival order.
+
+    :param rate: number of requests allowed per second
+    :type rate: float
+    :param burst: number of requests that can be made at once after an idle
+        period
+    :type burst: integer
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        Creates a new :class:`RateLimiter` instance.
+        """
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._order = itertools.count()
+        self._wakeup = None
+        self._paused_until = 0
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Wait until a request can be made.
+
+        :param priority: priority of the request, lower is served first
+        :type priority: integer
+        """
+        if self.try_acquire():
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), future))
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the token was granted to a waiter that went away
+                self._tokens += 1
+                self._wake()
+            raise
+
+    def pause(self, seconds):
+        """
+        Hand out no request slot for some time, e.g. when the server asked
+        to retry later.
+
+        Slots saved up so far are dropped and none are added during the
+        pause, so requests don't all resume at once.
+
+        :param seconds: duration of the pause
+        :type seconds: float
+        """
+        self._refill()
+        self._tokens = 0
+        self._paused_until = max(self._paused_until,
+                                 time.monotonic() + seconds)
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._schedule()
+
+    def try_acquire(self):
+        """
+        Take a request slot only if one is available right away.
+
+        :returns: whether the request can be made
+        """
+        self._refill()
+        if self._paused_until > self._updated:
+            return False
+        while self._waiters and self._waiters[0][2].done():
+            # cancelled waiters
+            heapq.heappop(self._waiters)
+        if self._tokens >= 1 and not self._waiters:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = max(0, now - max(self._updated, self._paused_until))
+        self._tokens = min(self._burst, self._tokens + elapsed * self._rate)
+        self._updated = now
+
+    def _schedule(self):
+        if self._wakeup is not None or not self._waiters:
+            return
+        delay = max(0, self._paused_until - time.monotonic()) + \
+            max(0, (1 - self._tokens) / self._rate)
+        self._wakeup = asyncio.get_event_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        self._refill()
+        if self._paused_until > self._updated:
+            self._schedule()
+            return
+        while self._waiters:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            elif self._tokens >= 1:
+                self._tokens -= 1
+                heapq.heappop(self._waiters)[2].set_result(None)
+            else:
+                break
+        self._schedule()
@@ -0,0 +1,369 @@
+from bisect import bisect
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import pickle
+import time
+
+from . import FoobotClient, DEFAULT_CONCURRENCY
+from .watch import DeviceWatcher, SAMPLE_INTERVAL, DEFAULT_DELAY
+
+DEFAULT_REPLICAS = 100
+DEFAULT_BATCH = 100
+DEFAULT_FLUSH_INTERVAL = 1
+
+
+class HashRing():
+    """
+    Consistent hash ring assigning keys to nodes
+
+    Each node is placed at `replicas` points of the ring, so keys are spread
+    evenly and removing a node only moves the keys it owned.
+
+    :param nodes: initial nodes
+    :type nodes: iterable
+    :param replicas: number of points of each node on the ring
+    :type replicas: integer
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        """
+        Creates a new :class:`HashRing` instance.
+        """
+        self._replicas = replicas
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._owners))
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+    def add(self, node):
+        """
+        Add a node to the ring.
+
+        :param node: node to add, its `str()` must be unique
+        :type node: object
+        """
+        for replica in range(self._replicas):
+            point = self._hash('{}-{}'.format(node, replica))
+            index = bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        """
+        Remove a node from the ring.
+
+        :param node: node to remove
+        :type node: object
+        """
+        kept = [(point, owner) for point, owner
+                in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def node_for(self, key):
+        """
+        Get the node owning a key.
+
+        :param key: key to look up
+        :type key: str
+        :returns: the node, or None if the ring is empty
+        """
+        if not self._points:
+            return None
+        index = bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class ShardedCollector():
+    """
+    Watch a very large fleet of devices from several worker processes
+
+    Devices are partitioned across the workers by consistent hashing. Each
+    worker runs its own event loop, :class:`FoobotClient` and
+    :class:`DeviceWatcher`, so response decoding and parsing use every
+    core, and sends its results back in batches through a pipe. When a
+    worker dies its devices are handed over to the remaining ones, catching
+    up from the last datapoint received. Devices given to a worker at once,
+    on start or on a handover, have their first polls spread over one
+    interval.
+
+    :param token: API secret key used for authentication
+    :type token: str
+    :param username: Your username for your Foobot account
+    :type username: str
+    :param uuids: Ids of the devices to watch
+    :type uuids: iterable of str
+    :param processes: number of worker processes, the number of CPUs by
+        default
+    :type processes: integer or None
+    :param interval: seconds between two samples of a device
+    :type interval: integer
+    :param delay: seconds to wait after a sample is expected before polling
+    :type delay: integer
+    :param concurrency: maximum number of requests in flight per worker
+    :type concurrency: integer
+    :param batch_size: maximum number of results sent at once by a worker
+    :type batch_size: integer
+    :param flush_interval: maximum seconds a worker holds results back to
+        fill a batch
+    :type flush_interval: float
+    :param kwargs: other :class:`FoobotClient` arguments, which must be
+        picklable
+
+    .. note::
+        Like :class:`DeviceWatcher`, the collector is an async iterator of
+        (uuid, list of new datapoints or exception). Workers are started on
+        the first iteration and stopped by `close()`:
+
+        .. code-block:: python
+
+            collector = ShardedCollector(token, username, uuids)
+            try:
+                async for uuid, datapoints in collector:
+                    ...
+            finally:
+                await collector.close()
+
+    .. note::
+        Pipes are watched with the event loop's `add_reader()`, which
+        requires a selector event loop.
+    """
+
+    def __init__(self, token, username, uuids, processes=None,
+                 interval=SAMPLE_INTERVAL, delay=DEFAULT_DELAY,
+                 concurrency=DEFAULT_CONCURRENCY, batch_size=DEFAULT_BATCH,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, **kwargs):
+        """
+        Creates a new :class:`ShardedCollector` instance.
+        """
+        self._token = token
+        self._username = username
+        self._options = dict(interval=interval, delay=delay,
+                             concurrency=concurrency, batch_size=batch_size,
+                             flush_interval=flush_interval, kwargs=kwargs)
+        self._processes = processes or os.cpu_count() or 1
+        self._ring = HashRing(range(self._processes))
+        self._last_times = {uuid: None for uuid in uuids}
+        self._assigned = {uuid: self._ring.node_for(uuid)
+                          for uuid in self._last_times}
+        self._workers = None
+        self._started = []
+        self._results = None
+        self._loop = None
+
+    def add(self, uuid, last_time=None):
+        """
+        Start watching a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param last_time: time of the last datapoint already known, to
+            catch up from
+        :type last_time: integer or None
+        """
+        if uuid in self._last_times:
+            return
+        self._last_times[uuid] = last_time
+        self._assigned[uuid] = self._ring.node_for(uuid)
+        if self._workers is not None:
+            self._send(self._assigned[uuid], ('add', uuid, last_time))
+
+    def remove(self, uuid):
+        """
+        Stop watching a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        """
+        self._last_times.pop(uuid, None)
+        worker = self._assigned.pop(uuid, None)
+        if self._workers is not None and worker is not None:
+            self._send(worker, ('remove', uuid))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._workers is None:
+            self._start()
+        result = await self._results.get()
+        if result is None:
+            self._results.put_nowait(None)
+            raise RuntimeError("All collector workers died")
+        return result
+
+    async def close(self, timeout=5):
+        """
+        Stop the workers.
+
+        :param timeout: seconds to wait for each worker to stop before
+            terminating it
+        :type timeout: float
+        """
+        if self._workers is None:
+            return
+        workers, self._workers = self._workers, None
+        for process, connection in workers.values():
+            self._loop.remove_reader(connection.fileno())
+            try:
+                connection.send(('stop',))
+            except OSError:
+                pass
+        for process in self._started:
+            await self._loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+                await self._loop.run_in_executor(None, process.join)
+        for process, connection in workers.values():
+            connection.close()
+        self._started = []
+
+    def _start(self):
+        self._loop = asyncio.get_event_loop()
+        self._results = asyncio.Queue()
+        self._workers = {}
+        context = multiprocessing.get_context('spawn')
+        for worker in range(self._processes):
+            uuids = {uuid: self._last_times[uuid]
+                     for uuid, assigned in self._assigned.items()
+                     if assigned == worker}
+            connection, child = context.Pipe()
+            process = context.Process(
+                target=_work, name='foobot-shard-{}'.format(worker),
+                args=(self._token, self._username, uuids, child),
+                kwargs=self._options, daemon=True)
+            process.start()
+            child.close()
+            self._started.append(process)
+            self._workers[worker] = (process, connection)
+            self._loop.add_reader(connection.fileno(), self._receive, worker)
+
+    def _send(self, worker, message):
+        if worker not in self._workers:
+            return
+        try:
+            self._workers[worker][1].send(message)
+        except OSError:
+            self._lost(worker)
+
+    def _receive(self, worker):
+        connection = self._workers[worker][1]
+        try:
+            while connection.poll():
+                for uuid, result in connection.recv():
+                    if self._assigned.get(uuid) != worker:
+                        # removed or handed over since
+                        continue
+                    if isinstance(result, list):
+                        self._last_times[uuid] = result[-1]['time']
+                    self._results.put_nowait((uuid, result))
+        except (EOFError, OSError):
+            self._lost(worker)
+
+    def _lost(self, worker):
+        if self._workers is None or worker not in self._workers:
+            return
+        process, connection = self._workers.pop(worker)
+        self._loop.remove_reader(connection.fileno())
+        connection.close()
+        self._ring.remove(worker)
+        if not self._workers:
+            self._results.put_nowait(None)
+            return
+        # devices are handed over in one message per worker, so that their
+        # polls are spread over one interval
+        handed_over = {}
+        for uuid, assigned in list(self._assigned.items()):
+            if assigned == worker:
+                self._assigned[uuid] = self._ring.node_for(uuid)
+                handed_over.setdefault(self._assigned[uuid], {})[uuid] = \
+                    self._last_times[uuid]
+        for node, devices in handed_over.items():
+            self._send(node, ('extend', devices))
+
+
+def _work(token, username, uuids, connection, **options):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_collect(token, username, uuids, connection,
+                                         **options))
+    finally:
+        connection.close()
+        loop.close()
+
+
+async def _collect(token, username, uuids, connection, interval, delay,
+                   concurrency, batch_size, flush_interval, kwargs):
+    loop = asyncio.get_event_loop()
+    client = FoobotClient(token, username, **kwargs)
+    watcher = DeviceWatcher(client, uuids, interval, delay, concurrency)
+    stopped = loop.create_future()
+
+    def command():
+        try:
+            while connection.poll():
+                message = connection.recv()
+                if message[0] == 'add':
+                    watcher.add(*message[1:])
+                elif message[0] == 'extend':
+                    watcher.extend(message[1])
+                elif message[0] == 'remove':
+                    watcher.remove(message[1])
+                elif not stopped.done():
+                    stopped.set_result(None)
+        except (EOFError, OSError):
+            # the parent went away
+            if not stopped.done():
+                stopped.set_result(None)
+
+    loop.add_reader(connection.fileno(), command)
+    batch = []
+    flushed = time.monotonic()
+    pending = None
+    try:
+        while not stopped.done():
+            if pending is None:
+                pending = asyncio.ensure_future(watcher.__anext__())
+            timeout = None
+            if batch:
+                timeout = max(0, flushed + flush_interval - time.monotonic())
+            await asyncio.wait([pending, stopped], timeout=timeout,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if pending.done():
+                uuid, result = pending.result()
+                pending = None
+                if isinstance(result, Exception):
+                    result = _picklable(result)
+                batch.append((uuid, result))
+            if batch and (len(batch) >= batch_size or stopped.done() or
+                          time.monotonic() - flushed >= flush_interval):
+                connection.send(batch)
+                batch = []
+                flushed = time.monotonic()
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    finally:
+        loop.remove_reader(connection.fileno())
+        if pending is not None:
+            pending.cancel()
+        await watcher.close()
+        await client.close()
+
+
+def _picklable(error):
+    # some aiohttp errors can't be rebuilt from their arguments
+    try:
+        pickle.loads(pickle.dumps(error))
+        return error
+    except Exception:
+        return FoobotClient.ClientError(repr(error))
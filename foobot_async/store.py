@@ -0,0 +1,182 @@
+from datetime import datetime, timezone, timedelta
+from math import trunc
+import sqlite3
+
+from . import SENSORS
+
+DEFAULT_SYNC_PERIOD = timedelta(days=42)
+
+
+def _timestamp(moment):
+    return trunc(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+class DataStore():
+    """
+    Local SQLite store of raw datapoints, kept up to date incrementally
+
+    Each device records the time range that was synced from the API, so
+    queries inside it are answered from the local index on time and only
+    the missing ranges are downloaded.
+
+    :param client: client used to download missing datapoints
+    :type client: FoobotClient
+    :param path: path of the database file, ':memory:' for a transient store
+    :type path: str
+
+    .. note::
+        Database operations are run in the event loop thread, they are local
+        and indexed so they only block it briefly.
+    """
+
+    def __init__(self, client, path):
+        """
+        Creates a new :class:`DataStore` instance.
+        """
+        self._client = client
+        self._db = sqlite3.connect(path)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS datapoints (uuid TEXT NOT NULL, '
+            'time INTEGER NOT NULL, pm REAL, tmp REAL, hum REAL, co2 REAL, '
+            'voc REAL, allpollu REAL, PRIMARY KEY (uuid, time)) '
+            'WITHOUT ROWID')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS syncs (uuid TEXT PRIMARY KEY, '
+            'start INTEGER NOT NULL, end INTEGER NOT NULL)')
+        self._db.commit()
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._db.close()
+
+    def synced_range(self, uuid):
+        """
+        Get the time range already synced for a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :returns: (start, end) as datetimes, or None if never synced
+        """
+        row = self._db.execute('SELECT start, end FROM syncs WHERE uuid = ?',
+                               (uuid,)).fetchone()
+        if row is None:
+            return None
+        return tuple(datetime.utcfromtimestamp(value) for value in row)
+
+    def last_time(self, uuid):
+        """
+        Get the time of the most recent datapoint stored for a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :returns: UTC timestamp or None if there is no datapoint
+        """
+        return self._db.execute(
+            'SELECT MAX(time) FROM datapoints WHERE uuid = ?',
+            (uuid,)).fetchone()[0]
+
+    async def sync(self, uuid, start=None, end=None):
+        """
+        Download the datapoints of a device missing from the store.
+
+        The first sync of a device downloads from `start`, or
+        `DEFAULT_SYNC_PERIOD` before `end`. Later syncs resume from the last
+        stored datapoint, and from `start` if it is older than the synced
+        range.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param start: oldest data to make available locally
+        :type start: datetime or None
+        :param end: most recent data to make available locally, now if None
+        :type end: datetime or None
+        :returns: number of datapoints downloaded
+        :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
+                 TooManyRequests, InternalError
+        """
+        end = _timestamp(end) if end is not None \
+            else trunc(datetime.now(timezone.utc).timestamp())
+        synced = self._db.execute(
+            'SELECT start, end FROM syncs WHERE uuid = ?', (uuid,)).fetchone()
+        if synced is None:
+            start = _timestamp(start) if start is not None \
+                else end - trunc(DEFAULT_SYNC_PERIOD.total_seconds())
+            ranges = [(start, end)]
+        else:
+            # resume from the last datapoint, as the ones uploaded late may be
+            # missing from the previous sync
+            resume = self.last_time(uuid)
+            resume = synced[1] if resume is None else min(resume, synced[1])
+            ranges = [(max(resume, synced[0]), end)]
+            if start is not None and _timestamp(start) < synced[0]:
+                ranges.insert(0, (_timestamp(start), synced[0]))
+            start = min(range_start for range_start, _ in ranges)
+        count = 0
+        for range_start, range_end in ranges:
+            if range_start >= range_end:
+                continue
+            async for batch in self._client.iter_historical_data(
+                    uuid,
+                    datetime.utcfromtimestamp(range_start),
+                    datetime.utcfromtimestamp(range_end)):
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO datapoints VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(uuid,) + tuple(datapoint.get(sensor)
+                                     for sensor in SENSORS)
+                     for datapoint in batch])
+                self._db.commit()
+                count += len(batch)
+        if synced is not None:
+            start, end = min(start, synced[0]), max(end, synced[1])
+        self._db.execute('INSERT OR REPLACE INTO syncs VALUES (?, ?, ?)',
+                         (uuid, start, end))
+        self._db.commit()
+        return count
+
+    def query(self, uuid, start, end):
+        """
+        Get the stored datapoints of a device for a time range.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param start: start of the range
+        :type start: datetime
+        :param end: end of the range
+        :type end: datetime
+        :returns: list of datapoints
+
+        .. seealso:: :func:`FoobotClient.parse_data` for return data syntax
+        """
+        rows = self._db.execute(
+            'SELECT {} FROM datapoints WHERE uuid = ? '
+            'AND time BETWEEN ? AND ? ORDER BY time'.format(
+                ', '.join(SENSORS)),
+            (uuid, _timestamp(start), _timestamp(end)))
+        return [dict(zip(SENSORS, row)) for row in rows]
+
+    async def get_historical_data(self, uuid, start, end):
+        """
+        Get the data from one device for a specified time range, downloading
+        it only if it is not covered by the synced range.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param start: start of the range
+        :type start: datetime
+        :param end: end of the range
+        :type end: datetime
+        :returns: list of datapoints
+        :raises: ClientError, AuthFailure, BadFormat, ForbiddenAccess,
+                 TooManyRequests, InternalError
+
+        .. seealso:: :func:`FoobotClient.parse_data` for return data syntax
+        """
+        synced = self._db.execute(
+            'SELECT start, end FROM syncs WHERE uuid = ?', (uuid,)).fetchone()
+        if synced is None or _timestamp(start) < synced[0] \
+                or _timestamp(end) > synced[1]:
+            await self.sync(uuid, start, end)
+        return self.query(uuid, start, end)
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+from . import FoobotClient, DEFAULT_CONCURRENCY
+
+
+class SyncFoobotClient():
+    """
+    Blocking Foobot API client, for synchronous code
+
+    Requests are run by a :class:`FoobotClient` on an event loop running in
+    a background thread for the whole life of the client, so connections are
+    reused between calls. Methods can be called from any number of threads,
+    and raise RuntimeError once the client is closed.
+
+    :param token: API secret key used for authentication
+    :type token: str
+    :param username: Your username for your Foobot account
+    :type username: str
+    :param kwargs: other :class:`FoobotClient` arguments
+
+    .. note::
+        The client is a context manager, stopping its thread on exit:
+
+        .. code-block:: python
+
+            with SyncFoobotClient(token, username) as client:
+                devices = client.get_devices()
+    """
+
+    def __init__(self, token, username, **kwargs):
+        """
+        Creates a new :class:`SyncFoobotClient` instance.
+        """
+        self._client = FoobotClient(token, username, **kwargs)
+        # guards the loop against being stopped while calls are submitted
+        self._lock = threading.Lock()
+        self._closed = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='foobot-async', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the client session and stop the background thread.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            future = self._submit(self._client.close())
+            self._closed = True
+        try:
+            future.result()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def _call(self, coroutine):
+        with self._lock:
+            if self._closed:
+                coroutine.close()
+                raise RuntimeError("Client is closed")
+            future = self._submit(coroutine)
+        return future.result()
+
+    def _submit(self, coroutine):
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError("Can't block the client's own event loop")
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def get_devices(self):
+        """
+        Get a list of devices associated with that account.
+
+        .. seealso:: :func:`FoobotClient.get_devices`
+        """
+        return self._call(self._client.get_devices())
+
+    def get_last_data(self, uuid, *args, **kwargs):
+        """
+        Get the data from one device for period till now.
+
+        .. seealso:: :func:`FoobotClient.get_last_data`
+        """
+        return self._call(self._client.get_last_data(uuid, *args, **kwargs))
+
+    def get_historical_data(self, uuid, *args, **kwargs):
+        """
+        Get the data from one device for a specified time range.
+
+        .. seealso:: :func:`FoobotClient.get_historical_data`
+        """
+        return self._call(self._client.get_historical_data(uuid, *args,
+                                                           **kwargs))
+
+    def get_last_data_batch(self, uuids, period=0, average_by=0,
+                            concurrency=DEFAULT_CONCURRENCY, **kwargs):
+        """
+        Get the data from several devices for period till now, concurrently.
+
+        :returns: dictionnary of list of datapoints or exception, by uuid
+
+        .. seealso:: :func:`FoobotClient.get_last_data_many`
+        """
+        return self._call(self._collect(self._client.get_last_data_many(
+            uuids, period, average_by, concurrency, **kwargs)))
+
+    def get_historical_data_batch(self, uuids, start, end, average_by=0,
+                                  concurrency=DEFAULT_CONCURRENCY, **kwargs):
+        """
+        Get the data from several devices for a specified time range,
+        concurrently.
+
+        :returns: dictionnary of list of datapoints or exception, by uuid
+
+        .. seealso:: :func:`FoobotClient.get_historical_data_many`
+        """
+        return self._call(self._collect(
+            self._client.get_historical_data_many(
+                uuids, start, end, average_by, concurrency, **kwargs)))
+
+    @staticmethod
+    async def _collect(results):
+        return {uuid: result async for uuid, result in results}
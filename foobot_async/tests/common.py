@@ -0,0 +1,18 @@
+import json
+
+UUID = "1234127987696AB"
+SENSORS = ["time", "pm", "tmp", "hum", "co2", "voc", "allpollu"]
+UNITS = ["s", "ugm3", "C", "pc", "ppm", "ppb", "%"]
+VALUES = [135.70001, 21.046001, 46.6885, 1178.0, 325.5, 131.19643]
+DEVICE_URL = 'https://api.foobot.io/v2/owner/{}/device/'
+LAST_URL = 'https://api.foobot.io/v2/device/{}/datapoint/0/last/0/'
+HISTORICAL_URL = 'https://api.foobot.io/v2/device/{}/datapoint/{}/{}/0/'
+
+
+def body(*times, **fields):
+    """
+    Datapoints response with the same values at every given time, extra
+    fields such as start and end being added as is.
+    """
+    return json.dumps(dict(fields, uuid=UUID, sensors=SENSORS, units=UNITS,
+                           datapoints=[[time] + VALUES for time in times]))
@@ -0,0 +1,17 @@
+import asyncio
+import pytest
+from foobot_async import FoobotClient
+
+
+@pytest.fixture(scope='module')
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope='module')
+def client(loop):
+    client = FoobotClient('token', 'example@example.com')
+    yield client
+    loop.run_until_complete(client.close())
@@ -0,0 +1,47 @@
+import pytest
+from foobot_async import FoobotClient
+from foobot_async.aggregate import aggregate, HOURLY
+
+client = FoobotClient('token', 'example@example.com')
+RESPONSE = {"sensors": ["time", "pm", "co2"],
+            "datapoints": [[1518130800, 10.0, 1000.0],
+                           [1518131100, 20.0, 1100.0],
+                           [1518131400, 30.0, 1300.0],
+                           [1518134400, 40.0, 900.0]]}
+
+
+def test_aggregate_rows():
+    resp = aggregate(client.parse_data(RESPONSE), HOURLY)
+
+    assert [dict(time=1518130800, pm=20.0, co2=1133.3333333333333),
+            dict(time=1518134400, pm=40.0, co2=900.0)] == resp
+
+
+def test_aggregate_columns():
+    resp = aggregate(client.parse_data(RESPONSE, output='columns'), HOURLY,
+                     'max')
+
+    assert [1518130800, 1518134400] == resp['time'].tolist()
+    assert [30.0, 40.0] == resp['pm'].tolist()
+    assert [1300.0, 900.0] == resp['co2'].tolist()
+
+
+def test_aggregate_percentile():
+    resp = aggregate(client.parse_data(RESPONSE), HOURLY, 'p50')
+
+    assert 20.0 == resp[0]['pm']
+    assert 1100.0 == resp[0]['co2']
+
+
+def test_aggregate_numpy():
+    pytest.importorskip('numpy')
+    expected = aggregate(client.parse_data(RESPONSE), HOURLY, 'p25')
+    resp = aggregate(client.parse_data(RESPONSE, output='numpy'), HOURLY,
+                     'p25')
+
+    assert [row['pm'] for row in expected] == resp['pm'].tolist()
+
+
+def test_aggregate_unknown_statistic():
+    with pytest.raises(ValueError):
+        aggregate(client.parse_data(RESPONSE), HOURLY, 'average')
@@ -0,0 +1,74 @@
+import pytest
+from statistics import mean, pvariance
+from foobot_async import FoobotClient
+from foobot_async.analytics import RollingAnalytics, AlertRule, EWMA, \
+    WindowStats
+
+client = FoobotClient('token', 'example@example.com')
+RESPONSE = {"sensors": ["time", "pm", "co2"],
+            "datapoints": [[1518130800, 10.0, 1000.0],
+                           [1518131100, 20.0, 1100.0],
+                           [1518131400, 30.0, 1500.0],
+                           [1518134400, 40.0, 900.0]]}
+
+
+def test_window_stats():
+    window = WindowStats(900)
+    values = [5.0, 1.0, 4.0, 2.0, 8.0, 3.0]
+    for index, value in enumerate(values):
+        window.update(index * 300, value)
+        kept = values[max(0, index - 2):index + 1]
+        assert len(kept) == window.count
+        assert mean(kept) == pytest.approx(window.mean)
+        assert pvariance(kept) == pytest.approx(window.variance)
+        assert min(kept) == window.min
+        assert max(kept) == window.max
+
+
+def test_ewma_halflife():
+    ewma = EWMA(halflife=300)
+    ewma.update(0, 0.0)
+    ewma.update(300, 10.0)
+    assert 5.0 == ewma.mean
+    assert 25.0 == ewma.variance
+
+
+def test_rolling_stats():
+    analytics = RollingAnalytics(window=3600)
+    assert [] == analytics.update('1234127987696AB',
+                                  client.parse_data(RESPONSE))
+    stats = analytics.stats('1234127987696AB', 'pm')
+    assert 3 == stats['count']
+    assert 30.0 == stats['mean']
+    assert 20.0 == stats['min']
+    assert 40.0 == stats['max']
+    assert analytics.stats('other', 'pm') is None
+
+
+def test_rolling_stats_columns_and_duplicates():
+    analytics = RollingAnalytics(sensors=['co2'])
+    analytics.update('1234127987696AB',
+                     client.parse_data(RESPONSE, output='columns'))
+    analytics.update('1234127987696AB', client.parse_data(RESPONSE))
+    assert 3 == analytics.stats('1234127987696AB', 'co2')['count']
+
+
+def test_alert_rising_edge():
+    analytics = RollingAnalytics(rules=[
+        AlertRule('co2 high', 'co2', 1200),
+        AlertRule('pm mean', 'pm', 15, statistic='mean')])
+    alerts = analytics.update('1234127987696AB', client.parse_data(RESPONSE))
+
+    assert [('co2 high', 1518131400, True),
+            ('pm mean', 1518131400, True),
+            ('co2 high', 1518134400, False)] == \
+        [(alert.rule.name, alert.time, alert.triggered) for alert in alerts]
+    assert {'pm mean'} == analytics.active('1234127987696AB')
+
+
+def test_alert_unknown_statistic():
+    with pytest.raises(ValueError):
+        AlertRule('co2', 'co2', 1200, statistic='median')
+    with pytest.raises(ValueError):
+        RollingAnalytics(sensors=['pm'],
+                         rules=[AlertRule('co2', 'co2', 1, 'mean')])
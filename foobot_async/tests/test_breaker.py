@@ -0,0 +1,55 @@
+import time
+from foobot_async.breaker import CircuitBreaker, StaleList, StaleDict, \
+    mark_stale
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.closed
+    breaker.record_failure()
+    assert not breaker.closed
+    assert not breaker.allow()
+
+
+def test_single_trial_after_reset_timeout():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.closed
+    assert breaker.allow()
+
+
+def test_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.closed
+
+
+def test_mark_stale():
+    stale = mark_stale([1, 2], 12)
+    assert isinstance(stale, StaleList)
+    assert [1, 2] == stale
+    assert 12 == stale.age
+    stale = mark_stale({'uuid': 'a'}, 3)
+    assert isinstance(stale, StaleDict)
+    assert 3 == stale.age
+
+
+def test_release_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert not breaker.closed
+    assert breaker.allow()
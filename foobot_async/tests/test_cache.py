@@ -0,0 +1,35 @@
+import time
+from foobot_async.cache import ResponseCache
+
+
+def test_hit_and_miss():
+    cache = ResponseCache()
+    assert cache.get('https://api.foobot.io/v2/owner/example@example.com/device/') is None
+    cache.set('https://api.foobot.io/v2/owner/example@example.com/device/',
+              [], 'devices')
+
+    assert [] == cache.get('https://api.foobot.io/v2/owner/example@example.com/device/')
+    assert dict(hits=1, misses=1, evictions=0, size=1) == cache.stats()
+
+
+def test_lru_eviction():
+    cache = ResponseCache(maxsize=2)
+    cache.set('a', 1, 'last')
+    cache.set('b', 2, 'last')
+    cache.get('a')
+    cache.set('c', 3, 'last')
+
+    assert cache.get('b') is None
+    assert 1 == cache.get('a')
+    assert 3 == cache.get('c')
+    assert 1 == cache.evictions
+
+
+def test_expiration():
+    cache = ResponseCache(ttl={'last': 0})
+    cache.set('a', 1, 'last')
+    cache.set('b', 2, 'last', immutable=True)
+    time.sleep(0.001)
+
+    assert cache.get('a') is None
+    assert 2 == cache.get('b')
@@ -0,0 +1,76 @@
+import csv
+import os
+import pytest
+from aioresponses import aioresponses
+from datetime import datetime, timedelta
+from foobot_async import FoobotClient
+from foobot_async.export import export
+from .common import UUID, HISTORICAL_URL, body
+
+
+def run_export(loop, client, directory, format='csv'):
+    return loop.run_until_complete(export(
+        client, ["1234127987696AB"],
+        datetime.utcfromtimestamp(1518120000),
+        datetime.utcfromtimestamp(1518121200),
+        str(directory), format, window=timedelta(seconds=600),
+        batch_size=1))
+
+
+def test_export_csv(loop, client, tmpdir):
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518120600),
+                   status=200, body=body(1518120000, 1518120300, 1518120600))
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120600, 1518121200),
+                   status=200, body=body(1518120600, 1518120900, 1518121200))
+
+        written = run_export(loop, client, tmpdir)
+
+    assert [os.path.join(str(tmpdir), "1234127987696AB", name)
+            for name in ('1518120000-1518120600.csv',
+                         '1518120600-1518121200.csv')] == written
+    with open(written[0], newline='') as exported:
+        rows = list(csv.DictReader(exported))
+    assert ['1518120000', '1518120300'] == [row['time'] for row in rows]
+    assert '1178.0' == rows[0]['co2']
+    with open(written[1], newline='') as exported:
+        assert 3 == len(list(csv.DictReader(exported)))
+
+
+def test_export_resume(loop, client, tmpdir):
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518120600),
+                   status=200, body=body(1518120000, 1518120300, 1518120600))
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120600, 1518121200),
+                   status=500, body='')
+
+        with pytest.raises(FoobotClient.InternalError):
+            run_export(loop, client, tmpdir)
+
+    assert ['1518120000-1518120600.csv'] == \
+        os.listdir(os.path.join(str(tmpdir), "1234127987696AB"))
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120600, 1518121200),
+                   status=200, body=body(1518120600))
+
+        written = run_export(loop, client, tmpdir)
+    assert [os.path.join(str(tmpdir), "1234127987696AB",
+                         '1518120600-1518121200.csv')] == written
+
+
+def test_export_parquet(loop, client, tmpdir):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518120600),
+                   status=200, body=body(1518120000, 1518120300, 1518120600))
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120600, 1518121200),
+                   status=200, body=body())
+
+        written = run_export(loop, client, tmpdir, 'parquet')
+
+    exported = parquet.ParquetFile(written[0])
+    assert 2 == exported.metadata.num_row_groups
+    table = exported.read()
+    assert [1518120000, 1518120300] == table.column('time').to_pylist()
+    assert [1178.0, 1178.0] == table.column('co2').to_pylist()
+    assert 0 == parquet.read_table(written[1]).num_rows
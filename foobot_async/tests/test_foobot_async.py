@@ -1,15 +1,24 @@
 import aiohttp
 import asyncio
+import foobot_async
+import json
 import pytest
-from aioresponses import aioresponses
+from aiohttp import web
+from aioresponses import aioresponses, CallbackResult
 from datetime import datetime
-from foobot_async import FoobotClient
+from foobot_async import FoobotClient, Metrics, RateLimiter, \
+    ResponseCache, _DatapointScanner
+from .common import LAST_URL, body
 
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
 client = FoobotClient('token', 'example@example.com')
 
 
+def teardown_module():
+    loop.run_until_complete(client.close())
+
+
 def test_get_devices_request():
     with aioresponses() as mocked:
         mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
@@ -24,22 +33,66 @@ def test_get_devices_request():
                      mac="013843C3C20A",
                      name="FooBot")] == resp
 
-# def test_get_devices_with_session_request():
-#     session = aiohttp.ClientSession()
-#     client = FoobotClient('token', 'example@example.com', session)
-#
-#     with aioresponses() as mocked:
-#         mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
-#                    status=200, body='''[{"uuid": "1234127987696AB",
-#                                        "userId": 2353,
-#                                        "mac": "013843C3C20A",
-#                                        "name": "FooBot"}]''')
-#         resp = loop.run_until_complete(client.get_devices())
-#
-#         assert [dict(uuid="1234127987696AB",
-#                      userId=2353,
-#                      mac="013843C3C20A",
-#                      name="FooBot")] == resp
+def test_get_devices_with_session_request():
+    async def get_devices():
+        async with aiohttp.ClientSession() as session:
+            client = FoobotClient('token', 'example@example.com', session)
+            resp = await client.get_devices()
+            await client.close()
+            assert not session.closed
+            return resp
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='''[{"uuid": "1234127987696AB",
+                                       "userId": 2353,
+                                       "mac": "013843C3C20A",
+                                       "name": "FooBot"}]''')
+        resp = loop.run_until_complete(get_devices())
+
+        assert [dict(uuid="1234127987696AB",
+                     userId=2353,
+                     mac="013843C3C20A",
+                     name="FooBot")] == resp
+
+
+def test_context_manager_request():
+    async def get_devices():
+        async with FoobotClient('token', 'example@example.com',
+                                limit=4) as client:
+            resp = await client.get_devices()
+            session = client._session
+        assert session.closed
+        assert client._session is None
+        return resp
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+
+        assert [] == loop.run_until_complete(get_devices())
+
+
+def test_shared_connector_request():
+    async def get_devices():
+        connector = aiohttp.TCPConnector()
+        async with FoobotClient('token', 'example@example.com',
+                                connector=connector) as first, \
+                FoobotClient('token', 'other@example.com',
+                             connector=connector) as second:
+            resp = await asyncio.gather(first.get_devices(),
+                                        second.get_devices())
+        assert not connector.closed
+        await connector.close()
+        return resp
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+        mocked.get('https://api.foobot.io/v2/owner/other@example.com/device/',
+                   status=200, body='[]')
+
+        assert [[], []] == loop.run_until_complete(get_devices())
 
 
 def test_failed_auth_request():
@@ -166,3 +219,492 @@ def test_get_bad_data_request():
                                                                datetime.utcfromtimestamp(1518121274),
                                                                datetime.utcfromtimestamp(1518131274),
                                                                3600))
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_get_last_data_many_request():
+    with aioresponses() as mocked:
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(1518131274))
+        mocked.get(LAST_URL.format('1234127987696AC'), status=500, body='')
+
+        resp = dict(loop.run_until_complete(collect(
+            client.get_last_data_many(["1234127987696AB", "1234127987696AC"],
+                                      concurrency=1))))
+        assert 1518131274 == resp["1234127987696AB"][0]['time']
+        assert isinstance(resp["1234127987696AC"], FoobotClient.InternalError)
+
+
+def test_get_historical_data_many_request():
+    with aioresponses() as mocked:
+        for uuid in ("1234127987696AB", "1234127987696AC"):
+            mocked.get('https://api.foobot.io/v2/device/' + uuid +
+                       '/datapoint/1518121274/1518131274/3600/',
+                       status=200, body=body(1518131274))
+
+        resp = dict(loop.run_until_complete(collect(
+            client.get_historical_data_many(["1234127987696AB", "1234127987696AC"],
+                                            datetime.utcfromtimestamp(1518121274),
+                                            datetime.utcfromtimestamp(1518131274),
+                                            3600))))
+        assert ["1234127987696AB", "1234127987696AC"] == sorted(resp)
+        assert 131.19643 == resp["1234127987696AC"][0]['allpollu']
+
+
+def test_get_historical_data_split_request():
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/device/1234127987696AB/datapoint/1514764800/1518393600/3600/',
+                   status=200, body=body(1514764800, 1518393600,
+                                         start=1514764800, end=1518393600))
+        mocked.get('https://api.foobot.io/v2/device/1234127987696AB/datapoint/1518393600/1519084800/3600/',
+                   status=200, body=body(1518393600, 1519084800,
+                                         start=1518393600, end=1519084800))
+
+        resp = loop.run_until_complete(client.get_historical_data("1234127987696AB",
+                                                                  datetime.utcfromtimestamp(1514764800),
+                                                                  datetime.utcfromtimestamp(1519084800),
+                                                                  3600))
+        assert [1514764800, 1518393600, 1519084800] == [d['time'] for d in resp]
+
+
+def test_split_range_average_longer_than_window():
+    assert [(0, 100)] == FoobotClient._split_range(0, 100, 86400 * 50)
+    assert [(0, 86400 * 60)] == \
+        FoobotClient._split_range(0, 86400 * 60, 86400 * 61)
+
+
+def test_parse_data_columns():
+    response = {"sensors": ["time", "pm", "tmp", "hum", "co2", "voc", "allpollu"],
+                "datapoints": [[1518131274, 135.70001, 21.046001, 46.6885, 1178.0,
+                                325.5, 131.19643],
+                               [1518131574, 134.5, 21.1, 46.5, 1170.0,
+                                320.0, 130.0]]}
+
+    resp = client.parse_data(response, output='columns')
+    assert [1518131274, 1518131574] == resp['time'].tolist()
+    assert 'q' == resp['time'].typecode
+    assert [1178.0, 1170.0] == resp['co2'].tolist()
+    assert 'd' == resp['co2'].typecode
+
+
+def test_parse_data_numpy():
+    numpy = pytest.importorskip('numpy')
+    response = {"sensors": ["time", "pm"],
+                "datapoints": [[1518131274, 135.70001]]}
+
+    resp = client.parse_data(response, output='numpy')
+    assert numpy.int64 == resp['time'].dtype
+    assert [135.70001] == resp['pm'].tolist()
+
+
+def test_parse_data_columns_bad_data():
+    with pytest.raises(FoobotClient.InvalidData):
+        client.parse_data({"sensors": ["time", "pm"],
+                           "datapoints": [[1518131274]]}, output='columns')
+
+
+def test_iter_historical_data_request():
+    payload = body(1518131274, 1518131574, 1518131874)
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/device/1234127987696AB/datapoint/1518121274/1518131274/3600/',
+                   status=200, body=payload)
+
+        resp = loop.run_until_complete(collect(
+            client.iter_historical_data("1234127987696AB",
+                                        datetime.utcfromtimestamp(1518121274),
+                                        datetime.utcfromtimestamp(1518131274),
+                                        3600, batch_size=2)))
+        assert [2, 1] == [len(batch) for batch in resp]
+        assert client.parse_data(json.loads(payload)) == resp[0] + resp[1]
+
+
+def test_iter_historical_data_failed_request():
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/device/1234127987696AB/datapoint/1518121274/1518131274/3600/',
+                   status=401, body='{"message": "invalid key provided"}')
+
+        with pytest.raises(FoobotClient.AuthFailure):
+            loop.run_until_complete(collect(
+                client.iter_historical_data("1234127987696AB",
+                                            datetime.utcfromtimestamp(1518121274),
+                                            datetime.utcfromtimestamp(1518131274),
+                                            3600)))
+
+
+def test_datapoint_scanner_chunks():
+    body = ('{"datapoints": [[1518131274, 135.7], [1518131574, 1e2]],'
+            ' "sensors": ["time", "pm"]}').encode('utf-8')
+    scanner = _DatapointScanner()
+    rows = []
+    for index in range(len(body)):
+        rows.extend(scanner.feed(body[index:index + 1]))
+    rows.extend(scanner.feed(b'', final=True))
+
+    assert [[1518131274, 135.7], [1518131574, 100.0]] == rows
+    assert ["time", "pm"] == scanner.sensors
+
+
+def test_iter_historical_data_streamed():
+    async def get_historical_data(request):
+        resp = web.StreamResponse()
+        resp.content_type = 'application/json'
+        await resp.prepare(request)
+        await resp.write(b'{"uuid": "1234127987696AB", "sensors": ["time", '
+                         b'"pm"], "units": ["s", "ugm3"], "datapoints": '
+                         b'[[1518131274, 135.7], [1518131574, 134.5], ')
+        # the rest is only sent once the first batch was received
+        await received.wait()
+        await resp.write(b'[1518131874, 133.5]]}')
+        await resp.write_eof()
+        return resp
+
+    async def run():
+        app = web.Application()
+        app.router.add_get('/v2/device/{uuid}/datapoint/{start}/{end}/0/',
+                           get_historical_data)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        stream_client = FoobotClient(
+            'token', 'example@example.com',
+            base_url='http://127.0.0.1:{}/v2/'.format(
+                runner.addresses[0][1]))
+        batches = []
+        try:
+            async for batch in stream_client.iter_historical_data(
+                    "1234127987696AB", datetime.utcfromtimestamp(1518131274),
+                    datetime.utcfromtimestamp(1518131874), batch_size=2):
+                batches.append(batch)
+                received.set()
+        finally:
+            await stream_client.close()
+            await runner.cleanup()
+        return batches
+
+    received = asyncio.Event()
+    resp = loop.run_until_complete(asyncio.wait_for(run(), 5))
+    assert [[1518131274, 1518131574], [1518131874]] == \
+        [[datapoint['time'] for datapoint in batch] for batch in resp]
+
+
+def test_datapoint_scanner_bad_data():
+    scanner = _DatapointScanner()
+    scanner.feed(b'{"uuid": "1234127987696AB", "datapoints": [[1518131274')
+
+    with pytest.raises(FoobotClient.InvalidData):
+        scanner.feed(b'', final=True)
+
+
+def test_retry_request():
+    retry_client = FoobotClient('token', 'example@example.com',
+                                retries=2, backoff=0)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=429, body='', headers={'Retry-After': '0'})
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=500, body='')
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+
+        assert [] == loop.run_until_complete(retry_client.get_devices())
+    loop.run_until_complete(retry_client.close())
+
+
+def test_retry_exhausted_request():
+    retry_client = FoobotClient('token', 'example@example.com',
+                                retries=1, backoff=0)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=429, body='', headers={'Retry-After': '0'})
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=429, body='', headers={'Retry-After': '0'})
+
+        with pytest.raises(FoobotClient.TooManyRequests) as error:
+            loop.run_until_complete(retry_client.get_devices())
+        assert 0 == error.value.retry_after
+    loop.run_until_complete(retry_client.close())
+
+
+def test_retry_after_over_max_backoff():
+    limiter = RateLimiter(rate=1000, burst=5)
+    retry_client = FoobotClient('token', 'example@example.com',
+                                rate_limiter=limiter, retries=2,
+                                max_backoff=60)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=429, body='', headers={'Retry-After': '3600'})
+
+        with pytest.raises(FoobotClient.TooManyRequests):
+            loop.run_until_complete(asyncio.wait_for(
+                retry_client.get_devices(), 1))
+        assert not limiter.try_acquire()
+    loop.run_until_complete(retry_client.close())
+
+
+def test_cached_request():
+    cached_client = FoobotClient('token', 'example@example.com',
+                                 cache=ResponseCache())
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+
+        assert [] == loop.run_until_complete(cached_client.get_devices())
+        assert [] == loop.run_until_complete(cached_client.get_devices())
+        assert 1 == cached_client._cache.hits
+    loop.run_until_complete(cached_client.close())
+
+
+def test_cached_devices_copied():
+    cached_client = FoobotClient('token', 'example@example.com',
+                                 cache=ResponseCache())
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[{"uuid": "1234127987696AB"}]')
+
+        devices = loop.run_until_complete(cached_client.get_devices())
+        devices[0]['name'] = 'changed'
+        devices.clear()
+        assert [dict(uuid="1234127987696AB")] == \
+            loop.run_until_complete(cached_client.get_devices())
+    loop.run_until_complete(cached_client.close())
+
+
+def test_coalesced_request():
+    async def get_twice():
+        return (await asyncio.gather(client.get_devices(),
+                                     client.get_devices()))
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+
+        assert [[], []] == loop.run_until_complete(get_twice())
+
+
+def test_coalesced_failed_request():
+    async def get_twice():
+        return (await asyncio.gather(client.get_devices(),
+                                     client.get_devices(),
+                                     return_exceptions=True))
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=500, body='')
+
+        resp = loop.run_until_complete(get_twice())
+        assert all(isinstance(error, FoobotClient.InternalError)
+                   for error in resp)
+
+
+def test_metrics_request():
+    payload = body(1518131274)
+    metrics = Metrics()
+    metrics_client = FoobotClient('token', 'example@example.com',
+                                  metrics=metrics)
+
+    with aioresponses() as mocked:
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=payload)
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=403, body='')
+
+        loop.run_until_complete(metrics_client.get_last_data("1234127987696AB"))
+        with pytest.raises(FoobotClient.ForbiddenAccess):
+            loop.run_until_complete(metrics_client.get_devices())
+    loop.run_until_complete(metrics_client.close())
+
+    snapshot = metrics.snapshot()
+    assert {200: 1} == snapshot['last']['statuses']
+    assert len(payload) == snapshot['last']['response_bytes']['sum']
+    assert 1 == snapshot['last']['parsed_rows']
+    assert {403: 1} == snapshot['devices']['statuses']
+
+
+def test_invalid_json_request():
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[{"uuid": ')
+
+        with pytest.raises(FoobotClient.InvalidData):
+            loop.run_until_complete(client.get_devices())
+
+
+def test_error_body_request():
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=401, body='{"message": "invalid key provided"}')
+
+        with pytest.raises(FoobotClient.AuthFailure) as error:
+            loop.run_until_complete(client.get_devices())
+        assert '{"message": "invalid key provided"}' == str(error.value)
+
+
+def test_custom_json_loads_request():
+    decoded = []
+
+    def loads(body):
+        decoded.append(body)
+        return json.loads(body)
+
+    json_client = FoobotClient('token', 'example@example.com',
+                               json_loads=loads)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=200, body='[]')
+
+        assert [] == loop.run_until_complete(json_client.get_devices())
+    loop.run_until_complete(json_client.close())
+    assert [b'[]'] == decoded
+
+
+def test_hedged_request():
+    calls = []
+
+    async def first_slow(url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+            return CallbackResult(status=200, body='["slow"]')
+        return CallbackResult(status=200, body='["fast"]')
+
+    hedged_client = FoobotClient('token', 'example@example.com',
+                                 hedge=True, hedge_budget=1)
+    for _ in range(20):
+        hedged_client._latency.observe('devices', 0.01)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   callback=first_slow, repeat=True)
+
+        resp = loop.run_until_complete(asyncio.wait_for(
+            hedged_client.get_devices(), 0.5))
+        assert ["fast"] == resp
+        assert 2 == len(calls)
+    loop.run_until_complete(hedged_client.close())
+
+
+def test_adaptive_timeout():
+    adaptive_client = FoobotClient('token', 'example@example.com',
+                                   timeout=10, adaptive_timeout=True)
+    assert 10 == adaptive_client._timeout_for('last')
+    for _ in range(20):
+        adaptive_client._latency.observe('last', 0.5)
+        adaptive_client._latency.observe('historical', 5)
+
+    assert 1.5 == adaptive_client._timeout_for('last')
+    assert 10 == adaptive_client._timeout_for('historical')
+
+
+def test_stale_while_revalidate():
+    stale_client = FoobotClient('token', 'example@example.com',
+                                stale_while_revalidate=True,
+                                failure_threshold=2, reset_timeout=30)
+    url = 'https://api.foobot.io/v2/owner/example@example.com/device/'
+    with aioresponses() as mocked:
+        mocked.get(url, status=200, body='["good"]')
+        mocked.get(url, status=500, body='', repeat=True)
+
+        assert ["good"] == loop.run_until_complete(stale_client.get_devices())
+        for _ in range(2):
+            with pytest.raises(FoobotClient.InternalError):
+                loop.run_until_complete(stale_client.get_devices())
+        resp = loop.run_until_complete(stale_client.get_devices())
+        assert ["good"] == resp
+        assert resp.age >= 0
+
+        mocked.get('https://api.foobot.io/v2/device/1234127987696AB/datapoint/600/last/601/',
+                   status=500, body='', repeat=True)
+        for _ in range(2):
+            with pytest.raises(FoobotClient.InternalError):
+                loop.run_until_complete(stale_client.get_last_data(
+                    "1234127987696AB", 600, 601))
+        with pytest.raises(FoobotClient.CircuitOpen):
+            loop.run_until_complete(stale_client.get_last_data(
+                "1234127987696AB", 600, 601))
+    loop.run_until_complete(stale_client.close())
+
+
+def test_circuit_trial_non_server_error():
+    stale_client = FoobotClient('token', 'example@example.com',
+                                stale_while_revalidate=True,
+                                failure_threshold=1, reset_timeout=0)
+    url = 'https://api.foobot.io/v2/owner/example@example.com/device/'
+    with aioresponses() as mocked:
+        mocked.get(url, status=500, body='')
+        mocked.get(url, status=429, body='')
+        mocked.get(url, status=200, body='["good"]')
+
+        with pytest.raises(FoobotClient.InternalError):
+            loop.run_until_complete(stale_client.get_devices())
+        with pytest.raises(FoobotClient.TooManyRequests):
+            loop.run_until_complete(stale_client.get_devices())
+        assert ["good"] == loop.run_until_complete(stale_client.get_devices())
+    loop.run_until_complete(stale_client.close())
+
+
+def test_circuit_cancelled_trial():
+    stale_client = FoobotClient('token', 'example@example.com',
+                                stale_while_revalidate=True,
+                                failure_threshold=1, reset_timeout=0)
+    url = 'https://api.foobot.io/v2/owner/example@example.com/device/'
+
+    async def slow(url, **kwargs):
+        await asyncio.sleep(1)
+        return CallbackResult(status=200, body='["slow"]')
+
+    with aioresponses() as mocked:
+        mocked.get(url, status=500, body='')
+        mocked.get(url, callback=slow)
+        mocked.get(url, status=200, body='["good"]')
+
+        with pytest.raises(FoobotClient.InternalError):
+            loop.run_until_complete(stale_client.get_devices())
+        with pytest.raises(asyncio.TimeoutError):
+            loop.run_until_complete(asyncio.wait_for(
+                stale_client.get_devices(), 0.05))
+        assert stale_client._breakers['devices'].allow()
+    loop.run_until_complete(stale_client.close())
+
+
+def test_adaptive_timeout_recovers(monkeypatch):
+    monkeypatch.setattr(foobot_async, 'MIN_ADAPTIVE_TIMEOUT', 0.1)
+    adaptive_client = FoobotClient('token', 'example@example.com',
+                                   timeout=30, adaptive_timeout=True)
+    for _ in range(20):
+        adaptive_client._latency.observe('devices', 0.01)
+
+    async def slow(url, **kwargs):
+        await asyncio.sleep(0.2)
+        return CallbackResult(status=200, body='[]')
+
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   callback=slow, repeat=True)
+
+        with pytest.raises(asyncio.TimeoutError):
+            loop.run_until_complete(adaptive_client.get_devices())
+        assert 0.1 < adaptive_client._timeout_for('devices')
+        assert [] == loop.run_until_complete(adaptive_client.get_devices())
+    loop.run_until_complete(adaptive_client.close())
+
+
+def test_circuit_coalesced_failure_counted_once():
+    stale_client = FoobotClient('token', 'example@example.com',
+                                stale_while_revalidate=True,
+                                failure_threshold=5)
+    with aioresponses() as mocked:
+        mocked.get('https://api.foobot.io/v2/owner/example@example.com/device/',
+                   status=500, body='')
+
+        results = loop.run_until_complete(asyncio.gather(
+            *[stale_client.get_devices() for _ in range(5)],
+            return_exceptions=True))
+        assert all(isinstance(result, FoobotClient.InternalError)
+                   for result in results)
+        assert 1 == sum(len(calls) for calls in mocked.requests.values())
+        assert stale_client._breakers['devices'].closed
+    loop.run_until_complete(stale_client.close())
@@ -0,0 +1,37 @@
+from foobot_async.metrics import Histogram, Metrics
+
+
+def test_histogram():
+    histogram = Histogram([1, 5])
+    for value in (0.5, 1, 3, 10):
+        histogram.observe(value)
+
+    assert [(1, 2), (5, 3), (float('inf'), 4)] == \
+        histogram.cumulative_counts()
+    assert 14.5 == histogram.sum
+    assert 4 == histogram.count
+
+
+def test_snapshot():
+    metrics = Metrics(latency_buckets=[1], size_buckets=[1024])
+    metrics.observe_request('last', 200, 0.2, 0.1, 512)
+    metrics.observe_request('last', 429, 0.2, 0.1, 0)
+    metrics.observe_timeout('last')
+    metrics.observe_parse('last', 0.01, 12)
+
+    snapshot = metrics.snapshot()['last']
+    assert {200: 1, 429: 1} == snapshot['statuses']
+    assert 1 == snapshot['timeouts']
+    assert 12 == snapshot['parsed_rows']
+    assert 2 == snapshot['headers_seconds']['count']
+
+
+def test_prometheus():
+    metrics = Metrics(latency_buckets=[1], size_buckets=[1024])
+    metrics.observe_request('devices', 200, 0.5, 0.25, 100)
+
+    text = metrics.to_prometheus()
+    assert '# TYPE foobot_request_duration_seconds histogram\n' in text
+    assert 'foobot_request_duration_seconds_bucket{endpoint="devices",phase="headers",le="1"} 1\n' in text
+    assert 'foobot_response_size_bytes_sum{endpoint="devices"} 100\n' in text
+    assert 'foobot_responses_total{endpoint="devices",status="200"} 1\n' in text
@@ -0,0 +1,61 @@
+import math
+from aioresponses import aioresponses
+from datetime import datetime
+from foobot_async import FoobotClient
+from foobot_async.aggregate import DAILY
+from foobot_async.planner import plan, fetch_matrix, MAX_WINDOW
+from .common import UUID, HISTORICAL_URL, body
+
+
+def test_plan_aligned_windows():
+    assert [(1518048000, 1518134400), (1518134400, 1518220800)] == \
+        plan(1518133800, 1518135000, window=DAILY)
+    assert [(1516838400, 1520467200)] == \
+        plan(1518133800, 1518135000, window=MAX_WINDOW)
+    assert [(1518130800, 1518134400)] == \
+        plan(1518131274, 1518131874, window=1)
+    assert [(1518127200, 1518134400)] == \
+        plan(1518131274, 1518131874, average_by=7200, window=3600)
+
+
+def test_plan_window_from_range():
+    # the last hour
+    assert [(1518130800, 1518134400), (1518134400, 1518138000)] == \
+        plan(1518133800, 1518135000)
+    # a few days
+    assert [(1517961600, 1518048000), (1518048000, 1518134400),
+            (1518134400, 1518220800)] == plan(1517961600, 1518135000)
+    # a few months
+    assert 3 == len(plan(1510000000, 1518135000))
+    assert [(1518048000, 1518134400)] == \
+        plan(1518131274, 1518131874, average_by=DAILY)
+
+
+def test_fetch_matrix(loop, client):
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518048000, 1518134400),
+                   status=200, body=body(1518133200, 1518133800, 1518134400))
+        mocked.get(HISTORICAL_URL.format(UUID, 1518134400, 1518220800),
+                   status=200, body=body(1518134400, 1518135000, 1518135300))
+        mocked.get(HISTORICAL_URL.format('BAD', 1518048000, 1518134400),
+                   status=500, body='')
+        mocked.get(HISTORICAL_URL.format('BAD', 1518134400, 1518220800),
+                   status=200, body=body())
+
+        matrix = loop.run_until_complete(fetch_matrix(
+            client, [UUID, 'BAD'], datetime.utcfromtimestamp(1518133800),
+            datetime.utcfromtimestamp(1518135000), sensors=['pm', 'co2'],
+            window=DAILY))
+
+    assert [1518133800, 1518134100, 1518134400, 1518134700,
+            1518135000] == matrix.times
+    assert ['pm', 'co2'] == matrix.sensors
+    assert [135.70001, None, 135.70001, None, 135.70001] == \
+        matrix.series(UUID, 'pm')
+    assert [None] * 5 == matrix.series('BAD', 'co2')
+    assert isinstance(matrix.errors['BAD'], FoobotClient.InternalError)
+
+    array = matrix.to_numpy()
+    assert (2, 5, 2) == array.shape
+    assert 1178.0 == array[0, 2, 1]
+    assert math.isnan(array[0, 1, 0])
@@ -0,0 +1,151 @@
+import asyncio
+import pytest
+from aioresponses import aioresponses
+from foobot_async import FoobotClient
+from foobot_async.pool import FoobotClientPool
+from foobot_async.ratelimit import RateLimiter
+from .common import DEVICE_URL, LAST_URL, body
+
+DEVICES = '''[{{"uuid": "{}", "userId": 2353, "mac": "013843C3C20A",
+              "name": "FooBot"}}]'''
+
+
+def mock_devices(mocked, username, uuid, remaining):
+    mocked.get(DEVICE_URL.format(username),
+               status=200, body=DEVICES.format(uuid),
+               headers={'X-API-KEY-LIMIT-REMAINING': str(remaining)})
+
+
+def test_route_by_owner(loop):
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com'),
+                                     ('token2', 'two@example.com')]) as pool:
+            devices = await pool.discover()
+            await pool.get_last_data("1234127987696AC")
+            return devices, mocked.requests
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 10)
+        mock_devices(mocked, 'two@example.com', '1234127987696AC', 10)
+        mocked.get(LAST_URL.format('1234127987696AC'), status=200,
+                   body=body(1518131274))
+
+        devices, requests = loop.run_until_complete(run())
+        assert ['1234127987696AB', '1234127987696AC'] == \
+            [device['uuid'] for device in devices]
+        call = [calls for key, calls in requests.items()
+                if '/datapoint/' in str(key[1])][0][0]
+        assert 'token2' == call.kwargs['headers']['X-API-KEY-TOKEN']
+
+
+def test_balance_quota(loop):
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com'),
+                                     ('token2', 'two@example.com')]) as pool:
+            await pool.discover()
+            resp = await pool.get_last_data("1234127987696AB")
+            return resp, pool.clients
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 50)
+        mock_devices(mocked, 'two@example.com', '1234127987696AB', 5)
+        mocked.get(LAST_URL.format('1234127987696AB'), status=429, body='',
+                   headers={'Retry-After': '30'})
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(1518131274))
+
+        resp, clients = loop.run_until_complete(run())
+        assert 1518131274 == resp[0]['time']
+        assert clients[0].throttled_until is not None
+        assert clients[1].throttled_until is None
+
+
+def test_unknown_device(loop):
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com')]) as pool:
+            await pool.get_last_data("1234127987696AC")
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 50)
+
+        with pytest.raises(FoobotClient.ForbiddenAccess):
+            loop.run_until_complete(run())
+
+
+def test_discover_failed_account(loop):
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com'),
+                                     ('token2', 'two@example.com')]) as pool:
+            devices = await pool.discover()
+            await pool.get_last_data("1234127987696AC")
+            return devices, pool.errors
+
+    with aioresponses() as mocked:
+        mocked.get(DEVICE_URL.format('one@example.com'), status=401, body='')
+        mock_devices(mocked, 'two@example.com', '1234127987696AC', 10)
+        mocked.get(LAST_URL.format('1234127987696AC'), status=200,
+                   body=body(1518131274))
+
+        devices, errors = loop.run_until_complete(run())
+        assert ['1234127987696AC'] == [device['uuid'] for device in devices]
+        assert isinstance(errors['one@example.com'], FoobotClient.AuthFailure)
+
+
+def test_unknown_device_rediscovery_interval(loop):
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com')]) as pool:
+            for _ in range(3):
+                with pytest.raises(FoobotClient.ForbiddenAccess):
+                    await pool.get_last_data("1234127987696AC")
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 50)
+
+        loop.run_until_complete(run())
+        assert 1 == sum(len(calls) for calls in mocked.requests.values())
+
+
+def test_reuse_after_close(loop):
+    async def run():
+        pool = FoobotClientPool([('token1', 'one@example.com')])
+        await pool.get_last_data("1234127987696AB")
+        await pool.close()
+        try:
+            return (await pool.get_last_data("1234127987696AB"))
+        finally:
+            await pool.close()
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 50)
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 50)
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(1518131274), repeat=True)
+
+        assert [1518131274] == [datapoint['time'] for datapoint
+                                in loop.run_until_complete(run())]
+
+
+def test_rate_limiter_per_account(loop):
+    with pytest.raises(ValueError):
+        FoobotClientPool([('token1', 'one@example.com')],
+                         rate_limiter=RateLimiter(1))
+
+    async def run():
+        async with FoobotClientPool([('token1', 'one@example.com'),
+                                     ('token2', 'two@example.com')],
+                                    rate=0.2, burst=2) as pool:
+            await pool.discover()
+            # a shared limiter would hold the second request for 5 seconds
+            return (await asyncio.wait_for(asyncio.gather(
+                pool.get_last_data("1234127987696AB"),
+                pool.get_last_data("1234127987696AC")), 1))
+
+    with aioresponses() as mocked:
+        mock_devices(mocked, 'one@example.com', '1234127987696AB', 10)
+        mock_devices(mocked, 'two@example.com', '1234127987696AC', 10)
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(1518131274))
+        mocked.get(LAST_URL.format('1234127987696AC'), status=200,
+                   body=body(1518131274))
+
+        assert 2 == len(loop.run_until_complete(run()))
@@ -0,0 +1,93 @@
+import asyncio
+import time
+from foobot_async.ratelimit import RateLimiter, PRIORITY_INTERACTIVE, \
+    PRIORITY_BULK
+
+
+def test_burst(loop):
+    limiter = RateLimiter(rate=1000, burst=3)
+
+    async def acquire_all():
+        for _ in range(3):
+            await limiter.acquire()
+
+    loop.run_until_complete(asyncio.wait_for(acquire_all(), 0.001))
+
+
+def test_priority_order(loop):
+    limiter = RateLimiter(rate=100, burst=1)
+    served = []
+
+    async def request(name, priority):
+        await limiter.acquire(priority)
+        served.append(name)
+
+    async def run():
+        await limiter.acquire()
+        await asyncio.gather(request('bulk 1', PRIORITY_BULK),
+                             request('bulk 2', PRIORITY_BULK),
+                             request('last', PRIORITY_INTERACTIVE))
+
+    loop.run_until_complete(run())
+    assert ['last', 'bulk 1', 'bulk 2'] == served
+
+
+def test_cancelled_waiter(loop):
+    limiter = RateLimiter(rate=100, burst=1)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+
+    loop.run_until_complete(run())
+
+
+def test_try_acquire():
+    limiter = RateLimiter(rate=0.001, burst=1)
+
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+
+def test_pause(loop):
+    limiter = RateLimiter(rate=1000, burst=5)
+    limiter.pause(0.05)
+    assert not limiter.try_acquire()
+
+    async def run():
+        started = loop.time()
+        await asyncio.wait_for(limiter.acquire(), 1)
+        return loop.time() - started
+
+    assert 0.04 <= loop.run_until_complete(run())
+
+
+def test_pause_drops_saved_slots(loop):
+    limiter = RateLimiter(rate=5, burst=5)
+    limiter.pause(0.05)
+
+    async def run():
+        await asyncio.sleep(0.3)
+        # one slot was added since the pause ended, not five
+        return [limiter.try_acquire() for _ in range(5)]
+
+    assert 1 == loop.run_until_complete(run()).count(True)
+
+
+def test_try_acquire_after_cancelled_waiter(loop):
+    limiter = RateLimiter(rate=20, burst=1)
+
+    async def run():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        # a slot is available before the limiter wakes up its waiters
+        time.sleep(0.1)
+        return limiter.try_acquire()
+
+    assert loop.run_until_complete(run())
@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+import time
+from aiohttp import web
+from foobot_async.shard import HashRing, ShardedCollector
+
+UUIDS = ['{:015X}'.format(0x1234127987696AB + index) for index in range(20)]
+
+
+def test_hash_ring_spread():
+    ring = HashRing(range(4))
+    owners = [ring.node_for(uuid) for uuid in UUIDS * 5]
+    assert {0, 1, 2, 3} == set(owners)
+    assert owners == [ring.node_for(uuid) for uuid in UUIDS * 5]
+
+
+def test_hash_ring_remove_moves_only_owned_keys():
+    ring = HashRing(range(4))
+    before = {uuid: ring.node_for(uuid) for uuid in UUIDS}
+    ring.remove(2)
+    assert 3 == len(ring)
+    for uuid in UUIDS:
+        if before[uuid] == 2:
+            assert 2 != ring.node_for(uuid)
+        else:
+            assert before[uuid] == ring.node_for(uuid)
+
+
+def test_hash_ring_empty():
+    assert HashRing().node_for('1234127987696AB') is None
+
+
+async def serve():
+    async def get_last_data(request):
+        now = int(time.time())
+        return web.json_response({
+            "uuid": request.match_info['uuid'],
+            "sensors": ["time", "pm", "tmp", "hum", "co2", "voc", "allpollu"],
+            "units": ["s", "ugm3", "C", "pc", "ppm", "ppb", "%"],
+            "datapoints": [[now, 135.7, 21.0, 46.6, 1178.0, 325.5, 131.1]]})
+
+    app = web.Application()
+    app.router.add_get('/v2/device/{uuid}/datapoint/{period}/last/{average}/',
+                       get_last_data)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, 'http://127.0.0.1:{}/v2/'.format(port)
+
+
+def test_sharded_collector_rebalance(loop):
+    # the collector spreads devices on the same ring
+    ring = HashRing(range(2))
+    moved = [uuid for uuid in UUIDS[:-1] if ring.node_for(uuid) == 0]
+
+    async def collect():
+        runner, base_url = await serve()
+        collector = ShardedCollector('token', 'example@example.com', UUIDS,
+                                     processes=2, interval=0.5, delay=0.1,
+                                     flush_interval=0.05, base_url=base_url)
+        try:
+            seen = set()
+            async for uuid, datapoints in collector:
+                assert 1 == len(datapoints)
+                seen.add(uuid)
+                if len(seen) == len(UUIDS):
+                    break
+            # devices of a dead worker are picked up by the other one
+            collector.remove(UUIDS[-1])
+            for process in multiprocessing.active_children():
+                if process.name == 'foobot-shard-0':
+                    process.terminate()
+            killed = time.time()
+            polled = set()
+            async for uuid, datapoints in collector:
+                assert UUIDS[-1] != uuid
+                if datapoints[0]['time'] > killed + 1:
+                    polled.add(uuid)
+                if polled.issuperset(moved):
+                    break
+        finally:
+            await collector.close()
+            await runner.cleanup()
+        return seen
+
+    assert moved
+    assert set(UUIDS) == loop.run_until_complete(
+        asyncio.wait_for(collect(), 30))
@@ -0,0 +1,82 @@
+from aioresponses import aioresponses
+from datetime import datetime, timezone
+from foobot_async.store import DataStore
+from .common import UUID, HISTORICAL_URL, body
+
+
+def test_incremental_sync(loop, client):
+    store = DataStore(client, ':memory:')
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518120600),
+                   status=200, body=body(1518120000, 1518120300,
+                                         start=1518120000, end=1518120600))
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120300, 1518121200),
+                   status=200, body=body(1518120300, 1518120600, 1518120900,
+                                         start=1518120300, end=1518121200))
+
+        assert 2 == loop.run_until_complete(store.sync(
+            "1234127987696AB",
+            datetime.utcfromtimestamp(1518120000),
+            datetime.utcfromtimestamp(1518120600)))
+        assert 3 == loop.run_until_complete(store.sync(
+            "1234127987696AB",
+            end=datetime.utcfromtimestamp(1518121200)))
+
+    assert 1518120900 == store.last_time("1234127987696AB")
+    assert (datetime.utcfromtimestamp(1518120000),
+            datetime.utcfromtimestamp(1518121200)) == \
+        store.synced_range("1234127987696AB")
+    resp = store.query("1234127987696AB",
+                       datetime.utcfromtimestamp(1518120000),
+                       datetime.utcfromtimestamp(1518121200))
+    assert [1518120000, 1518120300, 1518120600, 1518120900] == \
+        [datapoint['time'] for datapoint in resp]
+    assert dict(time=1518120000,
+                pm=135.70001,
+                tmp=21.046001,
+                hum=46.6885,
+                co2=1178.0,
+                voc=325.5,
+                allpollu=131.19643) == resp[0]
+    store.close()
+
+
+def test_local_historical_data(loop, client):
+    store = DataStore(client, ':memory:')
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518121200),
+                   status=200, body=body(1518120000, 1518120300, 1518120600,
+                                         start=1518120000, end=1518121200))
+
+        resp = loop.run_until_complete(store.get_historical_data(
+            "1234127987696AB",
+            datetime.utcfromtimestamp(1518120000),
+            datetime.utcfromtimestamp(1518121200)))
+        assert 3 == len(resp)
+        # answered locally, nothing else is mocked
+        resp = loop.run_until_complete(store.get_historical_data(
+            "1234127987696AB",
+            datetime.utcfromtimestamp(1518120300),
+            datetime.utcfromtimestamp(1518120600)))
+        assert [1518120300, 1518120600] == \
+            [datapoint['time'] for datapoint in resp]
+    store.close()
+
+
+def test_local_historical_data_aware_datetimes(loop, client):
+    store = DataStore(client, ':memory:')
+    with aioresponses() as mocked:
+        mocked.get(HISTORICAL_URL.format(UUID, 1518120000, 1518121200),
+                   status=200, body=body(1518120000, 1518120300,
+                                         start=1518120000, end=1518121200))
+
+        loop.run_until_complete(store.get_historical_data(
+            "1234127987696AB",
+            datetime.fromtimestamp(1518120000, timezone.utc),
+            datetime.fromtimestamp(1518121200, timezone.utc)))
+        resp = loop.run_until_complete(store.get_historical_data(
+            "1234127987696AB",
+            datetime.fromtimestamp(1518120300, timezone.utc),
+            datetime.fromtimestamp(1518120600, timezone.utc)))
+        assert [1518120300] == [datapoint['time'] for datapoint in resp]
+    store.close()
@@ -0,0 +1,46 @@
+import pytest
+import warnings
+from aioresponses import aioresponses
+from concurrent.futures import ThreadPoolExecutor
+from foobot_async import FoobotClient
+from foobot_async.sync import SyncFoobotClient
+from .common import DEVICE_URL, LAST_URL, body
+
+
+def test_sync_requests():
+    with aioresponses() as mocked, \
+            SyncFoobotClient('token', 'example@example.com') as client:
+        mocked.get(DEVICE_URL.format('example@example.com'), status=200,
+                   body='[]', repeat=True)
+        mocked.get(LAST_URL.format('1234127987696AB'), status=401, body='')
+
+        with ThreadPoolExecutor(4) as executor:
+            resp = list(executor.map(lambda _: client.get_devices(),
+                                     range(8)))
+        assert [[]] * 8 == resp
+        with pytest.raises(FoobotClient.AuthFailure):
+            client.get_last_data('1234127987696AB')
+
+
+def test_sync_batch():
+    with aioresponses() as mocked, \
+            SyncFoobotClient('token', 'example@example.com') as client:
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(1518131274))
+        mocked.get(LAST_URL.format('1234127987696AC'), status=500, body='')
+
+        resp = client.get_last_data_batch(['1234127987696AB',
+                                           '1234127987696AC'])
+        assert 1518131274 == resp['1234127987696AB'][0]['time']
+        assert isinstance(resp['1234127987696AC'], FoobotClient.InternalError)
+
+
+def test_sync_closed():
+    client = SyncFoobotClient('token', 'example@example.com')
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: client.close(), range(4)))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        with pytest.raises(RuntimeError):
+            client.get_devices()
@@ -0,0 +1,109 @@
+import asyncio
+import re
+import time
+from aioresponses import aioresponses, CallbackResult
+from foobot_async import FoobotClient
+from foobot_async.watch import DeviceWatcher
+from .common import LAST_URL, body
+
+
+async def first_results(watcher, count):
+    results = []
+    async for result in watcher:
+        results.append(result)
+        if len(results) == count:
+            break
+    await watcher.close()
+    return results
+
+
+def test_watch_last_data(loop, client):
+    now = int(time.time())
+    with aioresponses() as mocked:
+        mocked.get(LAST_URL.format('1234127987696AB'), status=200,
+                   body=body(now))
+        mocked.get(LAST_URL.format('1234127987696AC'), status=500, body='')
+
+        watcher = DeviceWatcher(client,
+                                ["1234127987696AB", "1234127987696AC"],
+                                interval=0.01)
+        resp = dict(loop.run_until_complete(
+            asyncio.wait_for(first_results(watcher, 2), 1)))
+        assert [now] == [datapoint['time']
+                         for datapoint in resp["1234127987696AB"]]
+        assert isinstance(resp["1234127987696AC"], FoobotClient.InternalError)
+
+
+def test_watch_catch_up(loop, client):
+    now = int(time.time())
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r'https://api\.foobot\.io/v2/device/'
+                              r'1234127987696AB/datapoint/\d+/last/0/'),
+                   status=200, body=body(now - 1200, now - 900, now - 600))
+
+        watcher = DeviceWatcher(client, [])
+        watcher.add("1234127987696AB", last_time=now - 900)
+        resp = loop.run_until_complete(
+            asyncio.wait_for(first_results(watcher, 1), 1))
+        assert [("1234127987696AB", [now - 600])] == \
+            [(uuid, [datapoint['time'] for datapoint in datapoints])
+             for uuid, datapoints in resp]
+        request = list(mocked.requests)[0][1]
+        assert '/datapoint/0/' not in str(request)
+
+
+def test_watch_long_catch_up(loop, client):
+    now = int(time.time())
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r'https://api\.foobot\.io/v2/device/'
+                              r'1234127987696AB/datapoint/\d+/\d+/0/'),
+                   status=200, body=body(now - 2 * 86400, now - 600))
+
+        watcher = DeviceWatcher(client, [])
+        watcher.add("1234127987696AB", last_time=now - 2 * 86400)
+        resp = loop.run_until_complete(
+            asyncio.wait_for(first_results(watcher, 1), 1))
+        assert [now - 600] == [datapoint['time']
+                               for datapoint in resp[0][1]]
+        request = list(mocked.requests)[0][1]
+        assert '/last/' not in str(request)
+
+
+def test_watch_remove_add(loop, client):
+    polls = []
+
+    def poll(url, **kwargs):
+        polls.append(url)
+        return CallbackResult(status=200, body=body())
+
+    async def watch(watcher):
+        results = asyncio.ensure_future(watcher.__anext__())
+        await asyncio.sleep(0.05)
+        watcher.remove("1234127987696AB")
+        watcher.add("1234127987696AB")
+        del polls[:]
+        await asyncio.sleep(1)
+        results.cancel()
+        await watcher.close()
+
+    with aioresponses() as mocked:
+        mocked.get(LAST_URL.format('1234127987696AB'), callback=poll,
+                   repeat=True)
+
+        loop.run_until_complete(watch(
+            DeviceWatcher(client, ["1234127987696AB"], interval=0.2)))
+        assert 4 <= len(polls) <= 6
+
+
+def test_watch_known_last_times(loop, client):
+    now = int(time.time())
+    with aioresponses() as mocked:
+        mocked.get(re.compile(r'https://api\.foobot\.io/v2/device/'
+                              r'1234127987696AB/datapoint/\d+/last/0/'),
+                   status=200, body=body(now - 1200, now - 600))
+
+        watcher = DeviceWatcher(client, {"1234127987696AB": now - 900})
+        resp = loop.run_until_complete(
+            asyncio.wait_for(first_results(watcher, 1), 1))
+        assert [now - 600] == [datapoint['time']
+                               for datapoint in resp[0][1]]
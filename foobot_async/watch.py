@@ -0,0 +1,229 @@
+from datetime import datetime
+import asyncio
+import heapq
+import itertools
+import time
+
+import aiohttp
+
+from . import FoobotClient, DEFAULT_CONCURRENCY
+
+SAMPLE_INTERVAL = 300
+DEFAULT_DELAY = 15
+MAX_CATCH_UP = 86400
+
+
+class DeviceWatcher():
+    """
+    Poll a fleet of devices in step with their sensors and yield only the
+    new datapoints
+
+    Each device is polled shortly after its next sample is expected, the
+    first polls being spread evenly over one sample interval to avoid
+    bursts. After a gap (missed samples, failed requests, ...) the missing
+    period is requested so that no datapoint is lost, as historical data
+    when it is longer than `MAX_CATCH_UP`.
+
+    :param client: client used to poll the devices
+    :type client: FoobotClient
+    :param uuids: Ids of the devices to watch, or dictionnary of the time
+        of their last datapoint already known by id
+    :type uuids: iterable of str or dict
+    :param interval: seconds between two samples of a device
+    :type interval: integer
+    :param delay: seconds to wait after a sample is expected before polling,
+        also used to retry when the sample isn't available yet
+    :type delay: integer
+    :param concurrency: maximum number of requests in flight
+    :type concurrency: integer
+
+    .. note::
+        The watcher is an async iterator of (uuid, list of new datapoints or
+        exception), failed polls are retried on the next interval:
+
+        .. code-block:: python
+
+            async for uuid, datapoints in DeviceWatcher(client, uuids):
+                ...
+    """
+
+    def __init__(self, client, uuids, interval=SAMPLE_INTERVAL,
+                 delay=DEFAULT_DELAY, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Creates a new :class:`DeviceWatcher` instance.
+        """
+        self._client = client
+        self._interval = interval
+        self._delay = delay
+        self._concurrency = concurrency
+        self._last_times = {}
+        self._generations = {}
+        self._generation = itertools.count()
+        self._schedule = []
+        self._results = None
+        self._changed = None
+        self._runner = None
+        self.extend(uuids)
+
+    def add(self, uuid, last_time=None):
+        """
+        Start watching a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        :param last_time: time of the last datapoint already known, to
+            catch up from
+        :type last_time: integer or None
+        """
+        if uuid in self._last_times:
+            return
+        self._last_times[uuid] = last_time
+        # entries and polls left by a previous watch of the device are
+        # ignored
+        self._generations[uuid] = next(self._generation)
+        heapq.heappush(self._schedule,
+                       (time.monotonic(), uuid, self._generations[uuid]))
+        if self._changed is not None:
+            self._changed.set()
+
+    def extend(self, devices):
+        """
+        Start watching several devices, their first polls being spread
+        evenly over one sample interval.
+
+        :param devices: Ids of the devices, or dictionnary of the time of
+            their last datapoint already known by id
+        :type devices: iterable of str or dict
+        """
+        if not isinstance(devices, dict):
+            devices = dict.fromkeys(devices)
+        devices = [(uuid, last_time) for uuid, last_time in devices.items()
+                   if uuid not in self._last_times]
+        now = time.monotonic()
+        for index, (uuid, last_time) in enumerate(devices):
+            self._last_times[uuid] = last_time
+            self._generations[uuid] = next(self._generation)
+            heapq.heappush(self._schedule,
+                           (now + index * self._interval / len(devices),
+                            uuid, self._generations[uuid]))
+        if devices and self._changed is not None:
+            self._changed.set()
+
+    def remove(self, uuid):
+        """
+        Stop watching a device.
+
+        :param uuid: Id of the device
+        :type uuid: str
+        """
+        self._last_times.pop(uuid, None)
+        self._generations.pop(uuid, None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._runner is None:
+            self._results = asyncio.Queue()
+            self._changed = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+        getter = asyncio.ensure_future(self._results.get())
+        try:
+            await asyncio.wait([getter, self._runner],
+                               return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not getter.done():
+                getter.cancel()
+        if getter.cancelled():
+            # the scheduler can only stop on an unexpected error
+            self._runner.result()
+        return getter.result()
+
+    async def close(self):
+        """
+        Stop polling.
+        """
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(self._concurrency)
+        polls = set()
+        try:
+            while True:
+                self._changed.clear()
+                while self._schedule and not self._current(
+                        *self._schedule[0][1:]):
+                    heapq.heappop(self._schedule)
+                timeout = None
+                if self._schedule:
+                    timeout = max(0, self._schedule[0][0] - time.monotonic())
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                _, uuid, generation = heapq.heappop(self._schedule)
+                await semaphore.acquire()
+                poll = asyncio.ensure_future(self._poll(uuid, generation))
+                poll.add_done_callback(lambda _: semaphore.release())
+                polls.add(poll)
+                poll.add_done_callback(polls.discard)
+        finally:
+            for poll in polls:
+                poll.cancel()
+
+    async def _poll(self, uuid, generation):
+        last_time = self._last_times.get(uuid)
+        now = time.time()
+        try:
+            if last_time is not None and now - last_time > MAX_CATCH_UP:
+                # too long for the last data endpoint
+                datapoints = await self._client.get_historical_data(
+                    uuid, datetime.utcfromtimestamp(last_time),
+                    datetime.utcfromtimestamp(now))
+            else:
+                period = 0
+                if last_time is not None and \
+                        now - last_time > 1.5 * self._interval:
+                    period = now - last_time
+                datapoints = await self._client.get_last_data(uuid, period,
+                                                              0)
+        except (FoobotClient.ClientError, aiohttp.ClientError,
+                asyncio.TimeoutError) as error:
+            if self._current(uuid, generation):
+                self._reschedule(uuid, self._interval)
+                await self._results.put((uuid, error))
+            return
+        if not self._current(uuid, generation):
+            return
+        if last_time is not None:
+            datapoints = [datapoint for datapoint in datapoints
+                          if datapoint['time'] > last_time]
+        if not datapoints:
+            # retry shortly while the sample is late, then at the normal pace
+            late = last_time is not None \
+                and now < last_time + 2 * self._interval
+            self._reschedule(uuid, self._delay if late else self._interval)
+            return
+        datapoints.sort(key=lambda datapoint: datapoint['time'])
+        last_time = datapoints[-1]['time']
+        self._last_times[uuid] = last_time
+        # poll again right after the next sample is expected
+        self._reschedule(uuid, max(self._delay, last_time + self._interval
+                                   + self._delay - time.time()))
+        await self._results.put((uuid, datapoints))
+
+    def _current(self, uuid, generation):
+        return self._generations.get(uuid) == generation
+
+    def _reschedule(self, uuid, delay):
+        heapq.heappush(self._schedule, (time.monotonic() + delay, uuid,
+                                        self._generations[uuid]))
+        self._changed.set()